@@ -0,0 +1,93 @@
+"""
+Access log written by a background thread
+
+Requests only put a dict on a queue. The writer thread turns them into json lines and
+writes them in batches, rotating the file by size or age. If the queue is full (the
+disk can't keep up) records are dropped and counted rather than holding up requests.
+"""
+
+import json
+import os
+import queue
+import threading
+import time
+
+ACCESS_LOG = "access_log.jsonl"
+
+
+class AccessLog:
+    def __init__(
+        self,
+        path: str = ACCESS_LOG,
+        max_bytes: int = 10 * 1024 * 1024,
+        max_age: float = 24 * 60 * 60,
+        backups: int = 5,
+        batch_size: int = 256,
+        flush_interval: float = 1.0,
+        queue_size: int = 10000,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.thread = None
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, name="access-log", daemon=True)
+            self.thread.start()
+
+    def log(self, **fields):
+        """
+        called on the request thread, never blocks
+        """
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        opened = time.time()
+        while True:
+            batch = [self.queue.get()]
+            # collect whatever else turns up within the flush interval
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            lines = "".join(json.dumps(fields, separators=(",", ":"), default=str) + "\n" for fields in batch)
+            with open(self.path, "a") as f:
+                f.write(lines)
+            self.written += len(batch)
+
+            if os.path.getsize(self.path) > self.max_bytes or time.time() - opened > self.max_age:
+                self.rotate()
+                opened = time.time()
+
+    def rotate(self):
+        """
+        access_log.jsonl -> access_log.jsonl.1 -> ... -> access_log.jsonl.<backups>
+        """
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        if os.path.exists(self.path):
+            os.replace(self.path, f"{self.path}.1")
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
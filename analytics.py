@@ -0,0 +1,91 @@
+"""
+Analysis done once per dataset, for every location at once
+"""
+
+from typing import Dict
+
+import numpy as np
+
+from locations import LocationStore
+
+# number of days of new cases the acceleration is fitted over
+ACCELERATION_WINDOW = 7
+
+# ways of deciding when the outbreak started in a location: name -> (metric, normalised, threshold)
+# the start is the last day the metric was still at or below the threshold
+START_CRITERIA = {
+    # 0.0001% of the population dead, what the site has always used
+    "per_capita": ("deaths", True, 0.0001),
+    "first_death": ("deaths", False, 0),
+    "ten_deaths": ("deaths", False, 9),
+    "hundred_cases": ("confirmed", False, 99),
+}
+DEFAULT_START = "per_capita"
+
+
+def slopes(matrix: np.ndarray) -> np.ndarray:
+    """
+    least squares gradient of each row against 0, 1, 2, ...
+    closed form, so it is one matrix product instead of a polyfit per row
+    """
+    x = np.arange(matrix.shape[1], dtype=float)
+    x -= x.mean()
+    return matrix @ x / (x @ x)
+
+
+def acceleration(store: LocationStore, window: int = ACCELERATION_WINDOW) -> Dict[str, np.ndarray]:
+    """
+    gradient of the daily new confirmed cases and deaths over the last window days of the
+    dataset, divided by population
+    returns metric -> array lined up with store.keys
+    """
+    result = {}
+    for metric in ["confirmed", "deaths"]:
+        # the extra day is needed for the first difference
+        daily = np.diff(store.counts[metric][:, -(window + 1):].astype(float), axis=1)
+        result[metric] = slopes(daily) / store.populations
+    return result
+
+
+def first_days(normalised_deaths: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    for each row, the last day deaths were still at or below threshold (percent of the
+    population), which is where the spread is counted as starting. 0 if never
+    """
+    below = normalised_deaths <= threshold
+    days = below.shape[1]
+    last = days - 1 - np.argmax(below[:, ::-1], axis=1)
+    return np.where(below.any(axis=1), last, 0)
+
+
+def starts(store: LocationStore, criterion: str = DEFAULT_START) -> np.ndarray:
+    """
+    outbreak start day of every location by one of START_CRITERIA
+    """
+    metric, normalised, threshold = START_CRITERIA[criterion]
+    matrix = store.normalised[metric] if normalised else store.counts[metric]
+    return first_days(matrix, threshold)
+
+
+def align(matrix: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    shift each row left by its offset, so column k is k days since that row's start
+    the days past the end of the data are NaN
+    """
+    days = matrix.shape[1]
+    columns = offsets[:, None] + np.arange(days)[None, :]
+    valid = columns < days
+    aligned = np.take_along_axis(matrix, np.minimum(columns, days - 1), axis=1).astype(float)
+    aligned[~valid] = np.nan
+    return aligned
+
+
+def alignment(store: LocationStore, criterion: str = DEFAULT_START) -> Dict[str, np.ndarray]:
+    """
+    "offsets" -> start day of every location, and metric -> normalised matrix aligned on it
+    """
+    offsets = starts(store, criterion)
+    result = {"offsets": offsets}
+    for metric, matrix in store.normalised.items():
+        result[metric] = align(matrix, offsets)
+    return result
@@ -0,0 +1,91 @@
+"""
+Data served to the page as json (or raw float32 for big requests), so charts can be
+drawn in the browser instead of being built into every page
+"""
+
+import json
+import struct
+from typing import List
+
+import numpy as np
+
+import analytics
+import locations
+import plot
+import projections
+
+
+def series(dataset: plot.Dataset, names: List[str], metrics: List[str], normalised: bool, start: str = analytics.DEFAULT_START) -> dict:
+    """
+    series of the locations in names, columnar
+    first_day is the index the spread started at in each location, by the start criterion
+    """
+    rows = [dataset.row(name) for name in names]
+    matrices = dataset.store.normalised if normalised else dataset.store.counts
+    values = {metric: matrices[metric][rows] for metric in metrics}
+    if normalised:
+        values = {metric: np.round(matrix, 8) for metric, matrix in values.items()}
+
+    return {
+        "version": dataset.version,
+        "start": dataset.dates[0].strftime("%Y-%m-%d"),
+        "days": len(dataset.dates),
+        "locations": names,
+        # what first_day counts as the start, see analytics.START_CRITERIA
+        "start_criterion": start,
+        "first_day": dataset.aligned(start)["offsets"][rows].tolist(),
+        "metrics": {metric: matrix.tolist() for metric, matrix in values.items()},
+    }
+
+
+def series_json(dataset: plot.Dataset, names: List[str], metrics: List[str], normalised: bool, start: str = analytics.DEFAULT_START) -> bytes:
+    return json.dumps(series(dataset, names, metrics, normalised, start), separators=(",", ":")).encode()
+
+
+def series_binary(dataset: plot.Dataset, names: List[str], metrics: List[str], normalised: bool, start: str = analytics.DEFAULT_START) -> bytes:
+    """
+    the json payload without the values, then the values as float32 little endian,
+    locations x metrics x days, for a javascript Float32Array
+    laid out as a uint32 little endian length of the json, the json (padded with spaces so
+    the floats start on a multiple of 4 bytes), the floats
+    """
+    payload = series(dataset, names, [], normalised, start)
+    rows = [dataset.row(name) for name in names]
+    matrices = dataset.store.normalised if normalised else dataset.store.counts
+    values = np.stack([matrices[metric][rows] for metric in metrics], axis=1)
+    payload["metrics"] = metrics
+    payload["shape"] = list(values.shape)
+
+    header = json.dumps(payload, separators=(",", ":")).encode()
+    header += b" " * (-(4 + len(header)) % 4)
+    return struct.pack("<I", len(header)) + header + values.astype("<f4").tobytes()
+
+
+def projection(dataset: plot.Dataset, names: List[str], metric: str, model: str, normalised: bool) -> dict:
+    """
+    projected cumulative counts of the locations in names, one list per band of projections.BANDS
+    """
+    rows = [dataset.row(name) for name in names]
+    values = dataset.projected[model][metric][rows]
+    if normalised:
+        values = np.round(values / dataset.store.populations[rows, None, None] * 100, 8)
+    else:
+        values = np.round(values)
+
+    return {
+        "version": dataset.version,
+        "model": model,
+        "metric": metric,
+        "fit_window": projections.FIT_WINDOW,
+        "dates": [date.strftime("%Y-%m-%d") for date in dataset.projected_dates],
+        "locations": names,
+        "bands": {band: values[:, i].tolist() for i, band in enumerate(projections.BANDS)},
+    }
+
+
+def parse_metrics(requested: List[str]) -> List[str]:
+    return [metric for metric in dict.fromkeys(requested) if metric in locations.METRICS] or ["deaths"]
+
+
+def parse_start(requested: str) -> str:
+    return requested if requested in analytics.START_CRITERIA else analytics.DEFAULT_START
@@ -0,0 +1,282 @@
+"""
+Benchmarks of the data load, analytics, charts and every route, on synthetic data
+
+    python benchmark.py [--locations 300] [--days 400] [--counties 3] [--repeat 20] [--json]
+    python benchmark.py --scale 100x100 300x400 1000x800
+
+Data is generated in CSSE's format into a temporary directory, which is made the working
+directory, so nothing is pulled and the real COVID-19 checkout is never touched. --scale
+runs the whole suite in a fresh process for each locations x days size and prints one
+table of mean times, to see how things grow before the real data gets there.
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import Callable, List
+
+import numpy as np
+import pandas as pd
+
+import population
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+TIME_SERIES = os.path.join("COVID-19", "csse_covid_19_data", "csse_covid_19_time_series")
+
+# always in the data, they are the default selections of the site
+REQUIRED = ["United Kingdom", "France", "Germany", "Spain"]
+US_STATES = [
+    "New York", "California", "Texas", "Florida", "Georgia", "Washington", "Illinois", "Ohio",
+    "Michigan", "Arizona", "Colorado", "Oregon", "Nevada", "Utah", "Iowa", "Kansas",
+]
+# CSSE's first day
+START = date(2020, 1, 22)
+
+
+# Synthetic data
+
+def curves(rng: np.random.Generator, rows: int, days: int, scale: float) -> np.ndarray:
+    """
+    cumulative counts, logistic curves starting from 0 at random days
+    """
+    t = np.arange(days)[None, :]
+    start = rng.integers(1, max(2, days // 2), rows)[:, None]
+    rate = rng.uniform(0.05, 0.25, rows)[:, None]
+    size = rng.uniform(0.1, 1.0, rows)[:, None] * scale
+    values = size / (1 + np.exp(-rate * (t - start - 40)))
+    values -= values[:, :1]
+    return np.floor(np.maximum.accumulate(values, axis=1)).astype(np.int64)
+
+
+def date_labels(days: int) -> List[str]:
+    dates = [START + timedelta(days=i) for i in range(days)]
+    return [f"{d.month}/{d.day}/{d.year % 100}" for d in dates]
+
+
+def generate(directory: str, locations: int = 300, days: int = 400, counties: int = 3, seed: int = 0):
+    """
+    write the five time series csvs under directory/COVID-19
+    locations is the number of rows in the global files, countries with known populations
+    first then made up provinces of them. every US state gets counties rows
+    """
+    rng = np.random.default_rng(seed)
+    path = os.path.join(directory, TIME_SERIES)
+    os.makedirs(path, exist_ok=True)
+    labels = date_labels(days)
+
+    countries = REQUIRED + sorted(set(population.registry(os.path.join(REPOSITORY, population.POPULATION_FILE)).figures) - set(REQUIRED))
+    rows = [(country, "") for country in countries[:locations]]
+    for i in range(locations - len(rows)):
+        rows.append((countries[i % len(countries)], f"Province {i}"))
+
+    ids = pd.DataFrame({
+        "Province/State": [province or np.nan for _, province in rows],
+        "Country/Region": [country for country, _ in rows],
+        "Lat": 1.0,
+        "Long": 1.0,
+    })
+    for name, scale in [("confirmed", 1e6), ("deaths", 3e4), ("recovered", 8e5)]:
+        values = pd.DataFrame(curves(rng, len(rows), days, scale), columns=labels)
+        pd.concat([ids, values], axis=1).to_csv(os.path.join(path, f"time_series_covid19_{name}_global.csv"), index=False)
+
+    us = pd.DataFrame([
+        {
+            "UID": 84000000 + i, "iso2": "US", "iso3": "USA", "code3": 840, "FIPS": float(1000 + i),
+            "Admin2": f"County {i}", "Province_State": state, "Country_Region": "US",
+            "Lat": 1.0, "Long_": 1.0, "Combined_Key": f"County {i}, {state}, US",
+        }
+        for i, state in enumerate(state for state in US_STATES for _ in range(counties))
+    ])
+    confirmed = pd.DataFrame(curves(rng, len(us), days, 1e5), columns=labels)
+    pd.concat([us, confirmed], axis=1).to_csv(os.path.join(path, "time_series_covid19_confirmed_US.csv"), index=False)
+    deaths = pd.DataFrame(curves(rng, len(us), days, 3e3), columns=labels)
+    people = us.assign(Population=rng.integers(10000, 2000000, len(us)))
+    pd.concat([people, deaths], axis=1).to_csv(os.path.join(path, "time_series_covid19_deaths_US.csv"), index=False)
+
+
+# Timing
+
+def measure(function: Callable, repeat: int) -> dict:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return {
+        "repeat": repeat,
+        "mean_ms": float(times.mean()),
+        "p50_ms": float(np.percentile(times, 50)),
+        "p95_ms": float(np.percentile(times, 95)),
+        "p99_ms": float(np.percentile(times, 99)),
+        "per_second": float(1000 / times.mean()) if times.mean() > 0 else float("inf"),
+    }
+
+
+def run(repeat: int) -> dict:
+    """
+    every benchmark, run in the directory holding the generated data
+    """
+    results = {}
+
+    # once only, these can't be repeated in the same process
+    start = time.perf_counter()
+    import plot
+    import analytics
+    import charts
+    import locations
+    import projections
+    import rankings
+    import web
+    results["import"] = {"repeat": 1, "mean_ms": (time.perf_counter() - start) * 1000}
+    start = time.perf_counter()
+    dataset = plot.load()
+    results["first_load"] = {"repeat": 1, "mean_ms": (time.perf_counter() - start) * 1000}
+    frames = plot.read_sources()
+    confirmed, deaths, recovered, confirmed_US, deaths_US = frames
+    names = sorted(dataset.country_data.keys())
+
+    def cold_build():
+        shutil.rmtree("snapshot", ignore_errors=True)
+        plot.build_dataset()
+
+    def load_all():
+        country_data = locations.CountryData(dataset.store)
+        for name in names:
+            country_data[name]["normalised_data"]
+
+    def encode(endpoint):
+        # the png encoding on its own, of a figure drawn once
+        from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+        fig = charts.figure(endpoint, web.DEFAULT_CHART_COUNTRIES, dataset)
+        FigureCanvas(fig)
+        return lambda: fig.savefig(io.BytesIO(), format="png", bbox_inches="tight")
+
+    benchmarks = {
+        "build_dataset_cold": cold_build,
+        "build_dataset": lambda: plot.build_dataset(),
+        "load": plot.read_sources,
+        "read_us": lambda: plot.read_us(confirmed_US, deaths_US),
+        "build_store": lambda: locations.build_store(confirmed, deaths, recovered),
+        "load_all_locations": load_all,
+        "acceleration": lambda: analytics.acceleration(dataset.store),
+        "rankings": lambda: rankings.Rankings(dataset),
+        "projections": lambda: projections.project(dataset.store),
+        "projections_serial": lambda: projections.project(dataset.store, processes=1),
+        "sorted_countries": lambda: plot.sorted_countries(dataset),
+        "summary_table": lambda: plot.summary_table(plot.sorted_countries(dataset), dataset),
+        "deaths_since_start": lambda: plot.deaths_since_start(web.DEFAULT_COUNTRIES, dataset),
+    }
+    for endpoint in charts.ENDPOINTS:
+        benchmarks[f"figure:{endpoint}"] = lambda endpoint=endpoint: charts.figure(endpoint, web.DEFAULT_CHART_COUNTRIES, dataset)
+        benchmarks[f"png:{endpoint}"] = encode(endpoint)
+        benchmarks[f"svg:{endpoint}"] = lambda endpoint=endpoint: charts.render_svg(endpoint, web.DEFAULT_CHART_COUNTRIES, dataset)
+
+    for name, function in benchmarks.items():
+        results[name] = measure(function, repeat)
+    # the builds above wrote the snapshot again, put back the dataset they didn't swap in
+    plot.swap(dataset)
+
+    client = web.app.test_client()
+    query = "?" + "&".join(f"{name}=on" for name in web.DEFAULT_COUNTRIES).replace(" ", "+")
+    routes = ["/", "/?All=on&Table_all=on", "/api/table?sort=deaths_per_capita&offset=20", "/update", "/stats", "/metrics"]
+    routes += [f"/{endpoint}.png{query}" for endpoint in charts.ENDPOINTS]
+    routes += [f"/{endpoint}.svg{query}" for endpoint in charts.ENDPOINTS]
+    routes += [
+        "/api/series?location=France&location=Spain&metric=deaths&normalised=1",
+        "/api/series?location=France&location=Spain&metric=deaths&metric=confirmed&format=binary",
+        "/api/projection?location=France&location=Spain&model=logistic&normalised=1",
+    ]
+
+    def get(route, cold):
+        def request():
+            if cold:
+                web.png_cache.clear()
+                web.svg_cache.clear()
+                web.page_cache.clear()
+                web.series_cache.clear()
+            response = client.get(route, base_url="http://ogent.uk")
+            assert response.status_code == 200, (route, response.status_code)
+        return request
+
+    for route in routes:
+        results[f"GET {route}"] = measure(get(route, True), repeat)
+        if ".png" in route or "/api/" in route:
+            results[f"GET {route} (cached)"] = measure(get(route, False), repeat)
+
+    return results
+
+
+def report(results: dict):
+    width = max(len(name) for name in results)
+    print(f"{'':{width}}  {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'per s':>9}")
+    for name, result in results.items():
+        if "p50_ms" not in result:
+            print(f"{name:{width}}  {result['mean_ms']:9.2f}")
+            continue
+        print(f"{name:{width}}  {result['mean_ms']:9.2f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} {result['p99_ms']:9.2f} {result['per_second']:9.1f}")
+
+
+def scale(sizes: List[str], counties: int, repeat: int):
+    """
+    the suite in a new process for each size, mean times side by side
+    """
+    columns = {}
+    for size in sizes:
+        locations, days = size.split("x")
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--locations", locations, "--days", days,
+             "--counties", str(counties), "--repeat", str(repeat), "--json"],
+            capture_output=True, text=True, check=True,
+        ).stdout
+        columns[size] = json.loads(output.strip().splitlines()[-1])
+
+    names = list(next(iter(columns.values())))
+    width = max(len(name) for name in names)
+    print(f"{'mean ms':{width}}  " + " ".join(f"{size:>12}" for size in sizes))
+    for name in names:
+        print(f"{name:{width}}  " + " ".join(f"{columns[size][name]['mean_ms']:12.2f}" for size in sizes))
+
+
+def main(args: List[str]):
+    options = {"--locations": "300", "--days": "400", "--counties": "3", "--repeat": "20"}
+    for option in options:
+        if option in args:
+            options[option] = args[args.index(option) + 1]
+    counties, repeat = int(options["--counties"]), int(options["--repeat"])
+
+    if "--scale" in args:
+        sizes = []
+        for arg in args[args.index("--scale") + 1:]:
+            if arg.startswith("--"):
+                break
+            sizes.append(arg)
+        scale(sizes, counties, repeat)
+        return
+
+    directory = tempfile.mkdtemp(prefix="covid_benchmark_")
+    try:
+        generate(directory, int(options["--locations"]), int(options["--days"]), counties)
+        shutil.copy(os.path.join(REPOSITORY, population.POPULATION_FILE), directory)
+        os.chdir(directory)
+        # a plain directory, so nothing is ever pulled
+        os.environ["COVID_DATA_SOURCE"] = "dir:" + TIME_SERIES
+        results = run(repeat)
+    finally:
+        os.chdir(REPOSITORY)
+        shutil.rmtree(directory, ignore_errors=True)
+
+    if "--json" in args:
+        print(json.dumps(results))
+    else:
+        report(results)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
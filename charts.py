@@ -0,0 +1,102 @@
+"""
+The charts, by endpoint name
+Each can be drawn by matplotlib as a png or straight to svg (see svg.py), FORMATS picks
+which one the pages link to.
+"""
+
+import io
+from typing import TYPE_CHECKING, List, Tuple
+
+import metrics
+import plot
+import projections
+import svg
+
+ENDPOINTS = [
+    "acceleration_deaths_plot",
+    "acceleration_deaths_plot_mobile",
+    "acceleration_confirmed_plot",
+    "acceleration_confirmed_plot_mobile",
+    "deaths_since_start_mobile",
+    "deaths_projection_plot",
+    "deaths_projection_plot_mobile",
+]
+
+# what the pages use for each chart, "svg" or "png", the other is still served
+FORMATS = {endpoint: "svg" for endpoint in ENDPOINTS}
+
+# matplotlib is imported when the first chart is drawn, not by everything importing this
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
+
+
+def mobile_fonts(fig: "Figure") -> "Figure":
+    """
+    increase font size
+    """
+    ax = fig.axes[0]
+    for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
+        item.set_fontsize(18)
+    return fig
+
+
+def figure(endpoint: str, countries: List[str], dataset: plot.Dataset = None) -> "Figure":
+    if endpoint == "acceleration_deaths_plot":
+        return plot.acceleration_deaths_plot(countries, dataset)
+    if endpoint == "acceleration_deaths_plot_mobile":
+        return mobile_fonts(plot.acceleration_deaths_plot(countries, dataset))
+    if endpoint == "acceleration_confirmed_plot":
+        return plot.acceleration_confirmed_plot(countries, dataset)
+    if endpoint == "acceleration_confirmed_plot_mobile":
+        return mobile_fonts(plot.acceleration_confirmed_plot(countries, dataset))
+    if endpoint == "deaths_projection_plot":
+        return plot.deaths_projection_plot(countries, dataset)
+    if endpoint == "deaths_projection_plot_mobile":
+        return mobile_fonts(plot.deaths_projection_plot(countries, dataset))
+    if endpoint == "deaths_since_start_mobile":
+        fig = plot.deaths_since_start_mobile(countries, dataset)
+        # make room for labels
+        fig.subplots_adjust(bottom=0.15)
+        return fig
+    raise KeyError(endpoint)
+
+
+def render(endpoint: str, countries: List[str], dataset: plot.Dataset = None, size: Tuple[float, float] = None) -> bytes:
+    """
+    the chart as png bytes, size in inches overrides the chart's own
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+
+    with metrics.timer("figure"):
+        fig = figure(endpoint, countries, dataset)
+    if size is not None:
+        fig.set_size_inches(*size)
+    output = io.BytesIO()
+    with metrics.timer("rasterize"):
+        FigureCanvas(fig)
+        fig.savefig(output, format="png", bbox_inches="tight")
+    return output.getvalue()
+
+
+def render_svg(endpoint: str, countries: List[str], dataset: plot.Dataset = None) -> bytes:
+    """
+    the chart as svg bytes, the same chart as render without matplotlib
+    """
+    dataset = dataset or plot.current()
+    style = svg.MOBILE if endpoint.endswith("_mobile") else svg.DESKTOP
+    with metrics.timer("svg"):
+        if endpoint.startswith("acceleration_deaths_plot"):
+            values = [plot.acceleration(country, dataset)[1] for country in countries]
+            return svg.bar_chart(countries, values, "#8f0000", "acceleration of deaths (% of population)", style).encode()
+        if endpoint.startswith("acceleration_confirmed_plot"):
+            values = [plot.acceleration(country, dataset)[0] for country in countries]
+            return svg.bar_chart(countries, values, "#537599", "acceleration of confirmed cases (% of population)", style).encode()
+        if endpoint == "deaths_since_start_mobile":
+            series = [dataset.since_start(country) for country in countries]
+            return svg.line_chart(countries, series, "Days since spread started in each country", "Percentage of the population", style).encode()
+        if endpoint.startswith("deaths_projection_plot"):
+            rows = [dataset.row(country) for country in countries]
+            history = [dataset.store.normalised["deaths"][row, -projections.FIT_WINDOW:] for row in rows]
+            projected = [dataset.projection(country) / dataset.store.populations[row] * 100 for country, row in zip(countries, rows)]
+            return svg.projection_chart(countries, history, projected, "Days from the latest data", "Percentage of the population", style).encode()
+    raise KeyError(endpoint)
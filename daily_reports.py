@@ -0,0 +1,357 @@
+"""
+Streaming ingest of the CSSE daily reports (csse_covid_19_daily_reports/MM-DD-YYYY.csv)
+
+    python daily_reports.py [--processes 4] [daily reports directory]
+
+The daily reports go down to county (Admin2) level for every country and have Active
+and incident rates, which the time series don't. There is one file per day, so they are
+read one day at a time, in chunks, by a pool of processes. Each day is folded into
+one column of a locations x dates matrix per metric, and the matrices are saved under
+snapshot/daily every CHECKPOINT_DAYS days, so an interrupted ingest carries on from the
+last saved day rather than starting again. Country names are put on the time series
+names (ALIASES, REGIONS) as each file is read.
+
+store() turns the result into a locations.LocationStore like the one the time series
+build, at county or province level, and merge() adds its rows to the time series store.
+plot.build_dataset does both when COVID_DAILY_REPORTS is set to the daily reports
+directory, e.g. COVID-19/csse_covid_19_data/csse_covid_19_daily_reports
+"""
+
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os.path import join
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import locations
+import snapshot
+
+DAILY_REPORTS = join("COVID-19", "csse_covid_19_data", "csse_covid_19_daily_reports")
+STATE_DIRECTORY = join(snapshot.SNAPSHOT_DIRECTORY, "daily")
+
+METRICS = ["confirmed", "deaths", "recovered", "active"]
+KEYS = ["Country_Region", "Province_State", "Admin2"]
+# rows read from a daily file at a time
+CHUNK_ROWS = 2000
+# days between saves
+CHECKPOINT_DAYS = 30
+PROCESSES = 4
+
+# the early files use different column names
+RENAME = {
+    "Country/Region": "Country_Region",
+    "Province/State": "Province_State",
+    "Last Update": "Last_Update",
+    "Incidence_Rate": "Incident_Rate",
+    "Confirmed": "confirmed",
+    "Deaths": "deaths",
+    "Recovered": "recovered",
+    "Active": "active",
+}
+
+# daily report country name -> time series name, where they differ (mostly the early files)
+ALIASES = {
+    "Mainland China": "China",
+    "South Korea": "Korea, South",
+    "Republic of Korea": "Korea, South",
+    "Iran (Islamic Republic of)": "Iran",
+    "UK": "United Kingdom",
+    "North Ireland": "United Kingdom",
+    "Republic of Ireland": "Ireland",
+    "Russian Federation": "Russia",
+    "Republic of Moldova": "Moldova",
+    "Czech Republic": "Czechia",
+    "Viet Nam": "Vietnam",
+    "Taiwan": "Taiwan*",
+    "Taipei and environs": "Taiwan*",
+    "occupied Palestinian territory": "West Bank and Gaza",
+    "Palestine": "West Bank and Gaza",
+    "The Bahamas": "Bahamas",
+    "Bahamas, The": "Bahamas",
+    "The Gambia": "Gambia",
+    "Gambia, The": "Gambia",
+    "Cape Verde": "Cabo Verde",
+    "Ivory Coast": "Cote d'Ivoire",
+    "East Timor": "Timor-Leste",
+    "Vatican City": "Holy See",
+}
+# early files had these as countries, the time series has them as provinces
+REGIONS = {
+    "Hong Kong": ("China", "Hong Kong"),
+    "Hong Kong SAR": ("China", "Hong Kong"),
+    "Macau": ("China", "Macau"),
+    "Macao SAR": ("China", "Macau"),
+}
+
+
+def report_date(filename: str) -> datetime:
+    return datetime.strptime(filename[:-len(".csv")], "%m-%d-%Y")
+
+
+def report_files(directory: str = DAILY_REPORTS) -> List[str]:
+    """
+    the daily files, oldest first
+    """
+    names = [name for name in os.listdir(directory) if name.endswith(".csv")]
+    return [join(directory, name) for name in sorted(names, key=report_date)]
+
+
+def read_day(path: str) -> Tuple[str, pd.DataFrame]:
+    """
+    runs in a worker
+    one daily file summed by (country, province, county), with an estimate of the
+    population from the incident rate (cases per 100,000)
+    returns the date as yyyy-mm-dd and the frame
+    """
+    parts = []
+    for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS, dtype={"FIPS": str}):
+        chunk = chunk.rename(columns=RENAME)
+        for column in KEYS:
+            if column not in chunk:
+                chunk[column] = ""
+        for metric in METRICS:
+            if metric not in chunk:
+                chunk[metric] = np.nan
+        chunk[KEYS] = chunk[KEYS].fillna("").astype(str).apply(lambda column: column.str.strip())
+        # on the time series names before grouping, so a location renamed part way through
+        # stays one row instead of two which both carry their last count forward
+        regions = chunk["Country_Region"].isin(list(REGIONS))
+        if regions.any():
+            moved = [REGIONS[name] for name in chunk.loc[regions, "Country_Region"]]
+            chunk.loc[regions, "Province_State"] = [province for _, province in moved]
+            chunk.loc[regions, "Country_Region"] = [country for country, _ in moved]
+        chunk["Country_Region"] = chunk["Country_Region"].replace(ALIASES)
+        chunk[METRICS] = chunk[METRICS].apply(pd.to_numeric, errors="coerce")
+
+        if "Incident_Rate" in chunk:
+            rate = pd.to_numeric(chunk["Incident_Rate"], errors="coerce")
+            chunk["population"] = (chunk["confirmed"] / rate * 100000).where(rate > 0)
+        else:
+            chunk["population"] = np.nan
+
+        parts.append(chunk.groupby(KEYS)[METRICS + ["population"]].sum(min_count=1))
+
+    day = pd.concat(parts).groupby(level=[0, 1, 2]).sum(min_count=1)
+    return report_date(os.path.basename(path)).strftime("%Y-%m-%d"), day
+
+
+class DailyReports:
+    def __init__(self, directory: str = STATE_DIRECTORY):
+        self.directory = directory
+        # (country, province, county) of each row
+        self.keys = []
+        self.index = {}
+        self.dates = []
+        # metric -> one array per date, each as long as keys was on that date
+        self.columns = {metric: [] for metric in METRICS}
+        self.populations = np.zeros(0)
+        self.load()
+
+    # saved state
+
+    def paths(self):
+        return {
+            "keys": join(self.directory, "keys.csv"),
+            "populations": join(self.directory, "populations.npy"),
+            "meta": join(self.directory, "meta.json"),
+            **{metric: join(self.directory, f"{metric}.npy") for metric in METRICS},
+        }
+
+    def load(self):
+        paths = self.paths()
+        try:
+            with open(paths["meta"]) as f:
+                meta = json.load(f)
+            keys = pd.read_csv(paths["keys"], keep_default_na=False, dtype=str)
+            matrices = {metric: np.load(paths[metric]) for metric in METRICS}
+            populations = np.load(paths["populations"])
+        except (OSError, ValueError):
+            return
+        # folded in under other names, start again
+        if meta.get("aliases") != self.aliases():
+            return
+        self.keys = list(keys.itertuples(index=False, name=None))
+        self.index = {key: row for row, key in enumerate(self.keys)}
+        self.dates = meta["dates"]
+        self.columns = {metric: list(matrix.T) for metric, matrix in matrices.items()}
+        self.populations = populations
+
+    @staticmethod
+    def aliases():
+        """
+        the names the saved state was folded in with, as they go in the json
+        """
+        return {"aliases": ALIASES, "regions": {name: list(key) for name, key in REGIONS.items()}}
+
+    def save(self):
+        """
+        same as the snapshot: temporary files renamed over the old ones, meta last
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        paths = self.paths()
+        for metric, matrix in self.matrices().items():
+            with open(paths[metric] + ".tmp", "wb") as f:
+                np.save(f, matrix)
+            os.replace(paths[metric] + ".tmp", paths[metric])
+        with open(paths["populations"] + ".tmp", "wb") as f:
+            np.save(f, self.populations)
+        os.replace(paths["populations"] + ".tmp", paths["populations"])
+        pd.DataFrame(self.keys, columns=KEYS).to_csv(paths["keys"] + ".tmp", index=False)
+        os.replace(paths["keys"] + ".tmp", paths["keys"])
+        with open(paths["meta"] + ".tmp", "w") as f:
+            json.dump({"dates": self.dates, "aliases": self.aliases()}, f)
+        os.replace(paths["meta"] + ".tmp", paths["meta"])
+
+    # ingest
+
+    def fold(self, date: str, day: pd.DataFrame):
+        """
+        add one day as the next column
+        locations missing from the day keep their last value, the counts are cumulative
+        """
+        for key in day.index:
+            if key not in self.index:
+                self.index[key] = len(self.keys)
+                self.keys.append(key)
+        rows = np.array([self.index[key] for key in day.index], dtype=np.int64)
+
+        for metric in METRICS:
+            column = np.zeros(len(self.keys), dtype=np.int32)
+            if self.columns[metric]:
+                previous = self.columns[metric][-1]
+                column[:len(previous)] = previous
+            values = day[metric].to_numpy()
+            reported = ~np.isnan(values)
+            column[rows[reported]] = values[reported]
+            self.columns[metric].append(column)
+
+        populations = np.full(len(self.keys), np.nan)
+        populations[:len(self.populations)] = self.populations
+        estimates = day["population"].to_numpy()
+        known = ~np.isnan(estimates)
+        populations[rows[known]] = estimates[known]
+        self.populations = populations
+
+        self.dates.append(date)
+
+    def ingest(self, directory: str = DAILY_REPORTS, processes: int = PROCESSES) -> int:
+        """
+        fold in every daily file after the last day already done, returns the number of days added
+        only a few days are read ahead of the one being folded, so memory stays bounded
+        """
+        last = self.dates[-1] if self.dates else ""
+        todo = [path for path in report_files(directory) if report_date(os.path.basename(path)).strftime("%Y-%m-%d") > last]
+        if not todo:
+            return 0
+
+        done = 0
+        with ProcessPoolExecutor(processes) as pool:
+            pending = deque()
+            for path in todo:
+                pending.append(pool.submit(read_day, path))
+                if len(pending) >= processes * 2:
+                    done += self.fold_next(pending)
+            while pending:
+                done += self.fold_next(pending)
+        self.save()
+        return done
+
+    def fold_next(self, pending: deque) -> int:
+        self.fold(*pending.popleft().result())
+        if len(self.dates) % CHECKPOINT_DAYS == 0:
+            self.save()
+        return 1
+
+    # results
+
+    def matrices(self) -> Dict[str, np.ndarray]:
+        """
+        metric -> locations x dates
+        """
+        result = {}
+        for metric, columns in self.columns.items():
+            matrix = np.zeros((len(self.keys), len(columns)), dtype=np.int32)
+            for day, column in enumerate(columns):
+                matrix[:len(column), day] = column
+            result[metric] = matrix
+        return result
+
+    def store(self, counties: bool = True) -> locations.LocationStore:
+        """
+        a location store like the time series one
+        counties=True has a row per county, named "County, Province" as the province
+        otherwise counties are summed into their province
+        """
+        keys = pd.MultiIndex.from_tuples(self.keys, names=KEYS)
+        frame = pd.DataFrame({"population": self.populations}, index=keys)
+        matrices = self.matrices()
+
+        if counties:
+            country = keys.get_level_values(0)
+            province = [", ".join(part for part in (county, province) if part) for _, province, county in self.keys]
+            grouping = [country, province]
+        else:
+            grouping = [keys.get_level_values(0), keys.get_level_values(1)]
+
+        counts = {}
+        for metric, matrix in matrices.items():
+            counts[metric] = pd.DataFrame(matrix, index=keys).groupby(grouping).sum().to_numpy(dtype=np.int32)
+        # unknown until every part of a location has an estimate
+        populations = frame.groupby(grouping)["population"].sum(min_count=1)
+        populations[frame["population"].isna().groupby(grouping).any()] = np.nan
+
+        store_keys = list(populations.index)
+        return locations.LocationStore(store_keys, pd.to_datetime(self.dates), counts, populations.to_numpy(dtype=float))
+
+
+def latest(directory: str = DAILY_REPORTS) -> str:
+    """
+    date of the newest daily file as yyyy-mm-dd, cheap enough to check on every refresh
+    """
+    try:
+        files = report_files(directory)
+    except OSError:
+        return ""
+    return report_date(os.path.basename(files[-1])).strftime("%Y-%m-%d") if files else ""
+
+
+def merge(store: locations.LocationStore, daily: locations.LocationStore) -> locations.LocationStore:
+    """
+    the time series store with every location only the daily reports have (counties,
+    provinces the time series don't split out) added on as extra rows
+    the daily rows are put on the store's dates, each date taking the last report on or
+    before it, 0 before the first
+    """
+    new = [row for row, key in enumerate(daily.keys) if key not in store.index]
+    if not new:
+        return store
+    # column of daily for each of the store's dates, -1 where there is no report yet
+    columns = np.searchsorted(daily.dates.values, store.dates.values, side="right") - 1
+    reported = columns >= 0
+
+    counts = {}
+    for metric, matrix in store.counts.items():
+        extra = np.zeros((len(new), len(store.dates)), dtype=matrix.dtype)
+        extra[:, reported] = daily.counts[metric][new][:, columns[reported]]
+        counts[metric] = np.concatenate([matrix, extra])
+    populations = np.concatenate([store.populations, daily.populations[new]])
+    keys = store.keys + [daily.keys[row] for row in new]
+    return locations.LocationStore(keys, store.dates, counts, populations)
+
+
+if __name__ == '__main__':
+    import sys
+    args = sys.argv[1:]
+    processes = PROCESSES
+    if "--processes" in args:
+        i = args.index("--processes")
+        processes = int(args[i + 1])
+        del args[i:i + 2]
+    reports = DailyReports()
+    added = reports.ingest(args[0] if args else DAILY_REPORTS, processes)
+    print(f"added {added} days, {len(reports.dates)} days of {len(reports.keys)} locations")
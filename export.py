@@ -0,0 +1,101 @@
+"""
+Export the report as a static site, so nginx or a CDN can serve it with no python involved
+
+    python export.py [output directory] [--selection "France|Spain" ...]
+
+For each selection of countries this writes a desktop and a mobile page plus every chart
+and the series json. Charts, json and pages are named by a hash of their content, so they
+can be cached forever. index.html and mobile.html are the first selection (the default
+main page) and manifest.json maps each selection to its pages. Anything not exported is
+left to the flask app.
+"""
+
+import hashlib
+import json
+import os
+from typing import List
+
+import charts
+import plot
+import web
+
+EXPORT_DIRECTORY = "export"
+
+# selections exported when none are given, the defaults the site is visited with
+SELECTIONS = [
+    web.DEFAULT_COUNTRIES,
+    web.DEFAULT_CHART_COUNTRIES,
+]
+
+
+def write_hashed(directory: str, name: str, extension: str, body: bytes) -> str:
+    """
+    write body as name.<hash>.extension, returns the file name
+    """
+    filename = f"{name}.{hashlib.sha1(body).hexdigest()[:12]}.{extension}"
+    path = os.path.join(directory, filename)
+    # same name means same content
+    if not os.path.exists(path):
+        with open(path, "wb") as f:
+            f.write(body)
+    return filename
+
+
+def write(path: str, body: bytes):
+    with open(path + ".tmp", "wb") as f:
+        f.write(body)
+    os.replace(path + ".tmp", path)
+
+
+def export(directory: str = EXPORT_DIRECTORY, selections: List[List[str]] = None, dataset: plot.Dataset = None) -> dict:
+    """
+    write the static site, returns the manifest
+    """
+    dataset = dataset or plot.DATASET
+    selections = selections or SELECTIONS
+    assets = os.path.join(directory, "assets")
+    os.makedirs(assets, exist_ok=True)
+
+    manifest = {"version": dataset.version, "pages": {}}
+    for i, countries in enumerate(selections):
+        countries = sorted({country for country in countries if country in dataset.country_data})
+
+        images = {}
+        for endpoint in charts.ENDPOINTS:
+            # png or svg, whichever the app's pages would link to
+            format = charts.FORMATS[endpoint]
+            draw = web.CHART_FORMATS[format][0]
+            images[endpoint] = "assets/" + write_hashed(assets, endpoint, format, draw(endpoint, countries, dataset)[0])
+        series = web.series(countries, ["deaths"], True, "json", dataset)
+        series_url = "assets/" + write_hashed(assets, "series", "json", series)
+
+        # pages are rendered as the app would, outside of any real request
+        with web.app.test_request_context():
+            desktop = web.page(dataset, False, False, images, series_url).encode()
+            mobile = web.page(dataset, False, True, images, series_url).encode()
+
+        pages = {
+            "desktop": write_hashed(directory, "page", "html", desktop),
+            "mobile": write_hashed(directory, "page", "html", mobile),
+        }
+        manifest["pages"]["|".join(countries)] = pages
+        if i == 0:
+            write(os.path.join(directory, "index.html"), desktop)
+            write(os.path.join(directory, "mobile.html"), mobile)
+
+    write(os.path.join(directory, "manifest.json"), json.dumps(manifest, indent=1).encode())
+    return manifest
+
+
+if __name__ == '__main__':
+    import sys
+    args = sys.argv[1:]
+    selections = []
+    while "--selection" in args:
+        i = args.index("--selection")
+        selections.append(args[i + 1].split("|"))
+        del args[i:i + 2]
+    # the latest data, as the server would have
+    plot.load(sync=True)
+    manifest = export(args[0] if args else EXPORT_DIRECTORY, selections)
+    print(f"exported {len(manifest['pages'])} selections of version {manifest['version']}")
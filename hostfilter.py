@@ -0,0 +1,62 @@
+"""
+Request filter, run before anything else so unwanted requests never reach the plotting code
+
+Each rule is checked in order and the first match answers the request. Nothing here
+sleeps: under waitress a sleeping request holds a worker thread, so a burst of scanner
+traffic used to starve real users.
+"""
+
+import threading
+from collections import Counter
+from typing import Callable, List, Optional
+
+from flask import Request, Response, redirect
+
+BANNED = ["118.172.154.178"]
+ALLOWED_HOSTS = ["ogent.uk", "bettercovid19data.com"]
+
+
+class Rule:
+    def __init__(self, name: str, matches: Callable[[Request], bool], respond: Callable[[], Response]):
+        self.name = name
+        self.matches = matches
+        self.respond = respond
+
+
+def host(request: Request) -> str:
+    return request.host.split(":")[0]
+
+
+RULES = [
+    Rule("banned", lambda request: request.remote_addr in BANNED, lambda: Response("Forbidden", status=403)),
+    # requests to the IP rather than a domain
+    Rule("ip_url", lambda request: request.host.startswith("146.148.32.5"), lambda: redirect("http://90.207.238.183")),
+    # for some reason we get a bunch of these
+    Rule("covid-19", lambda request: host(request) == "covid-19", lambda: Response("Not Found", status=404)),
+    # just capture all cases too
+    Rule("other_host", lambda request: host(request) not in ALLOWED_HOSTS, lambda: redirect("http://www.google.com")),
+]
+
+
+class Filter:
+    def __init__(self, rules: List[Rule] = None):
+        self.rules = RULES if rules is None else rules
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def check(self, request: Request) -> Optional[Response]:
+        """
+        response for a rejected request, None to let it through
+        """
+        for rule in self.rules:
+            if rule.matches(request):
+                with self.lock:
+                    self.counts[rule.name] += 1
+                return rule.respond()
+        with self.lock:
+            self.counts["allowed"] += 1
+        return None
+
+    def stats(self) -> dict:
+        with self.lock:
+            return dict(self.counts)
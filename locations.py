@@ -0,0 +1,143 @@
+"""
+Location store: every location's counts in one matrix per metric (locations x dates)
+
+Rows are looked up through an index keyed by (country, province), so getting any
+location's series is a dict lookup and a view into the matrix, no scanning.
+Normalised counts (percentage of the population) are one divide over each matrix.
+"""
+
+from collections.abc import Mapping
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+import population
+import snapshot
+
+METRICS = ["confirmed", "deaths", "recovered"]
+
+
+def name(country: str, province: str = "") -> str:
+    """
+    display name of a location, "Hubei, China" for provinces
+    """
+    return f"{province}, {country}" if province else country
+
+
+class LocationStore:
+    def __init__(self, keys: List[Tuple[str, str]], dates: pd.DatetimeIndex, counts: Dict[str, np.ndarray], populations: np.ndarray, normalised: Dict[str, np.ndarray] = None):
+        self.keys = keys
+        self.index = {key: row for row, key in enumerate(keys)}
+        self.dates = dates
+        self.counts = counts
+        # NaN where the population isn't known
+        self.populations = populations
+        # can be passed in when it was worked out already, see shared.py
+        if normalised is None:
+            normalised = {metric: matrix / populations[:, None] * 100 for metric, matrix in counts.items()}
+        self.normalised = normalised
+
+    def __contains__(self, key: Tuple[str, str]) -> bool:
+        return key in self.index
+
+    def row(self, country: str, province: str = "") -> int:
+        return self.index[(country, province)]
+
+    def series(self, metric: str, country: str, province: str = "") -> np.ndarray:
+        """
+        a view of one location's counts, not a copy
+        """
+        return self.counts[metric][self.row(country, province)]
+
+    def frame(self, country: str, province: str = "") -> pd.DataFrame:
+        """
+        a location as a dataframe with confirmed, deaths, recovered as columns, dates as index
+        """
+        row = self.row(country, province)
+        return pd.DataFrame({metric: self.counts[metric][row] for metric in METRICS}, index=self.dates, copy=False)
+
+    def normalised_frame(self, country: str, province: str = "") -> pd.DataFrame:
+        """
+        as frame() but as a percentage of the population
+        """
+        row = self.row(country, province)
+        return pd.DataFrame({metric: self.normalised[metric][row] for metric in METRICS}, index=self.dates, copy=False)
+
+
+def build_store(confirmed: pd.DataFrame, deaths: pd.DataFrame, recovered: pd.DataFrame, known_populations: dict = None) -> LocationStore:
+    """
+    build the store from the global format dataframes in one go
+    countries only reported by province (Australia, China, ...) also get a total row
+    known_populations is passed on to the population registry
+    """
+    dates = [column for column in deaths.columns if snapshot.is_date(column)]
+
+    def indexed(df):
+        df = df.assign(**{'Province/State': df['Province/State'].fillna("")})
+        df = df.set_index(['Country/Region', 'Province/State'])[dates]
+        return df[~df.index.duplicated()]
+
+    frames = {"confirmed": indexed(confirmed), "deaths": indexed(deaths), "recovered": indexed(recovered.reindex(columns=list(recovered.columns[:4]) + dates))}
+
+    # add the totals for countries without a country level row
+    keys = list(frames["deaths"].index)
+    has_total = {country for country, province in keys if province == ""}
+    totals = sorted({country for country, _ in keys} - has_total)
+    for metric, df in frames.items():
+        summed = df[df.index.get_level_values(0).isin(totals)].groupby(level=0).sum()
+        if len(summed):
+            summed.index = pd.MultiIndex.from_tuples([(country, "") for country in summed.index])
+            frames[metric] = pd.concat([df, summed])
+    keys += [(country, "") for country in totals]
+
+    counts = {}
+    for metric in ["confirmed", "deaths"]:
+        counts[metric] = frames[metric].reindex(keys).fillna(0).to_numpy(dtype=np.int32)
+
+    # places without recovered data use deaths, like they always have
+    recovered = frames["recovered"].reindex(keys)
+    missing = recovered.isna().all(axis=1).to_numpy()
+    # to_numpy can hand back a read only view, so no assigning into it
+    counts["recovered"] = np.where(missing[:, None], counts["deaths"], recovered.fillna(0).to_numpy(dtype=np.int32))
+
+    populations = population.registry().populations(keys, known_populations)
+
+    return LocationStore(keys, pd.to_datetime(dates, format="%m/%d/%y"), counts, populations)
+
+
+class CountryData(Mapping):
+    """
+    looks like the old COUNTRY_DATA dict, name -> population, province, data, normalised_data
+    holds every location with a known population
+    each entry is built from the store the first time it is asked for
+    """
+    def __init__(self, store: LocationStore):
+        self.store = store
+        self.locations = {
+            name(*key): key for key, people in zip(store.keys, store.populations) if np.isfinite(people)
+        }
+        self.entries = {}
+
+    def __getitem__(self, location: str) -> dict:
+        entry = self.entries.get(location)
+        if entry is None:
+            country, province = self.locations[location]
+            entry = {
+                "population": self.store.populations[self.store.row(country, province)],
+                "province": province,
+                "data": self.store.frame(country, province),
+                "normalised_data": self.store.normalised_frame(country, province),
+            }
+            self.entries[location] = entry
+        return entry
+
+    def __contains__(self, location) -> bool:
+        # without this Mapping would build the entry just to check it exists
+        return location in self.locations
+
+    def __iter__(self):
+        return iter(self.locations)
+
+    def __len__(self) -> int:
+        return len(self.locations)
@@ -0,0 +1,166 @@
+"""
+Timings of the hot paths, aggregated into histograms and served as prometheus text
+
+    with metrics.timer("summary_table"):
+        ...
+
+Every timer is recorded against the endpoint of the request it ran in (blank outside of
+a request, e.g. a background refresh). The timings of the current request are also kept
+so they can be sent back in a Server-Timing header.
+"""
+
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# upper bounds in seconds, from a cache hit to a full data load
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "covid_request_seconds": "Time to answer a request",
+    "covid_stage_seconds": "Time spent in each stage of building a response or a dataset",
+    "covid_refresh_seconds": "Duration of the last data refresh",
+    "covid_refreshes_total": "Data refreshes run, by result",
+    "covid_dataset_build_seconds": "Duration of the last dataset build",
+    "covid_dataset_bytes": "Memory used by the arrays of the current dataset",
+    "covid_dataset_locations": "Locations in the current dataset",
+    "covid_dataset_days": "Days in the current dataset",
+    "covid_process_max_rss_bytes": "Peak resident memory of the process",
+}
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def labels(values: Dict[str, str]) -> str:
+    def escape(value):
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return ",".join(f'{key}="{escape(value)}"' for key, value in values.items())
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # name -> label values -> histogram / value
+        self.histograms = {}
+        self.gauges = {}
+        self.counters = {}
+
+    def observe(self, name: str, value: float, **label_values):
+        key = tuple(sorted(label_values.items()))
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    def set(self, name: str, value: float, **label_values):
+        with self.lock:
+            self.gauges.setdefault(name, {})[tuple(sorted(label_values.items()))] = value
+
+    def inc(self, name: str, amount: float = 1, **label_values):
+        key = tuple(sorted(label_values.items()))
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def exposition(self) -> str:
+        """
+        everything in the prometheus text format
+        """
+        lines = []
+        with self.lock:
+            for kind, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in sorted(series.items()):
+                        lines.append(f"{name}{{{labels(dict(key))}}} {value}" if key else f"{name} {value}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{{{labels(dict(key + (('le', bound),)))}}} {cumulative}")
+                    lines.append(f"{name}_sum{{{labels(dict(key))}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels(dict(key))}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+# a process forked while another thread held the lock (a render_pool worker) would wait on it forever
+os.register_at_fork(after_in_child=lambda: setattr(registry, "lock", threading.Lock()))
+
+# (endpoint, [(stage, seconds), ...]) of the request being answered on this thread
+current = contextvars.ContextVar("current", default=None)
+
+
+def begin(endpoint: str):
+    """
+    start collecting the timings of a request
+    """
+    current.set((endpoint or "", []))
+
+
+def end() -> List[Tuple[str, float]]:
+    """
+    timings of the request, in the order they finished
+    """
+    request = current.get()
+    current.set(None)
+    return request[1] if request else []
+
+
+@contextmanager
+def timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        request = current.get()
+        registry.observe("covid_stage_seconds", elapsed, stage=stage, endpoint=request[0] if request else "")
+        if request:
+            request[1].append((stage, elapsed))
+
+
+def server_timing(timings: List[Tuple[str, float]], total: float) -> str:
+    """
+    Server-Timing header value, stages that ran more than once are added up
+    """
+    stages = {}
+    for stage, elapsed in timings:
+        stages[stage] = stages.get(stage, 0.0) + elapsed
+    stages["total"] = total
+    return ", ".join(f"{stage};dur={elapsed * 1000:.2f}" for stage, elapsed in stages.items())
+
+
+def max_rss() -> int:
+    """
+    peak resident memory in bytes, 0 where it can't be found (windows)
+    """
+    try:
+        import resource
+    except ImportError:
+        return 0
+    import sys
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on mac
+    return rss if sys.platform == "darwin" else rss * 1024
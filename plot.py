@@ -1,221 +1,288 @@
-# get new data from github repository https://github.com/CSSEGISandData/COVID-19
-import platform
-import subprocess
-from functools import lru_cache
+# data from github repository https://github.com/CSSEGISandData/COVID-19, see sources.py
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime
 # imports and globals
 from itertools import cycle
-from os.path import join
 from typing import List
 
-import bokeh.models
-import matplotlib
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from bokeh.palettes import Colorblind as palette
-from bokeh.plotting import figure, output_file, show, ColumnDataSource
-from matplotlib.figure import Figure
-
-if platform.system() == "Windows":
-    process = subprocess.Popen("cd COVID-19 & git fetch & git pull", stdout=subprocess.PIPE, shell=True)
-if platform.system() == "Linux":
-    process = subprocess.Popen("cd COVID-19 ; git fetch ; git pull", stdout=subprocess.PIPE, shell=True)
-print(process.communicate()[0].strip().decode())
-
-
-matplotlib.use('Agg')
-
-BASE_DIRECTORY = "COVID-19/csse_covid_19_data/csse_covid_19_time_series"
-
-COUNTRY_DATA = {
-    "United Kingdom": {
-        "population": 66440000, #2018
-        "province": "",
-    },
-    "France": {
-        "population": 66990000, #2019
-        "province": "",
-    },
-    "Germany": {
-        "population": 82790000, #2018
-        "province": "",
-    },
-    "Spain": {
-        "population":46660000, #2018
-        "province": "",
-    },
-    "Italy" : {
-        "population":60480000, #2018
-        "province": "",
-    },
-    "Poland" :{
-        "population":37980000, #2018
-        "province": "",
-    },
-    "Norway" : {
-        "population": 5368000, #2020
-        "province": "",
-    },
-    "Sweden" : {
-        "population" : 10120000, #2018
-        "province": "",
-    },
-    "China" : {
-        "population": 59020000, # 2017 just Hubei
-        "province": "Hubei",
-    },
-    "Korea, South": {
-        "population": 51470000, #2017
-        "province": "",
-    },
-    "US": {
-        "population": 327200000, #2018
-        "province": "",
-    },
-    "New York": {
-        "population": 8623000, #2017
-        "province": "",
-    },
-    "India": {
-        "population": 1339000000, #2017
-        "province": "",
-    },
-    "Mexico": {
-        "population": 129200000, #2017
-        "province": "",
-    },
-    "Iran": {
-        "population": 81160000, #2017
-        "province": "",
-    },
-    "Netherlands": {
-        "population": 17280000, #2019
-        "province": "",
-    }
-}
 
+import analytics
+import daily_reports
+import locations
+import metrics
+import projections
+import rankings
+import snapshot
+import sources
 
+# where the csv files come from, see sources.py
+SOURCE = sources.default()
 
-# load the datasets
-confirmed = pd.read_csv(join(BASE_DIRECTORY, "time_series_covid19_confirmed_global.csv"))
-deaths = pd.read_csv(join(BASE_DIRECTORY, "time_series_covid19_deaths_global.csv"))
-recovered = pd.read_csv(join(BASE_DIRECTORY, "time_series_covid19_recovered_global.csv"))
-# load the US dataset (which is in a different format)
-confirmed_US = pd.read_csv(join(BASE_DIRECTORY,"time_series_covid19_confirmed_US.csv"))
-deaths_US = pd.read_csv(join(BASE_DIRECTORY,"time_series_covid19_deaths_US.csv"))
+# county level rows from the daily reports, off unless this is set to their directory
+DAILY_REPORTS = os.environ.get("COVID_DAILY_REPORTS")
 
 
-def read_us(confirmed_US, deaths_US, state: str):
-    global deaths, confirmed
+def read_sources(source: sources.Source = None, hashes: dict = None) -> List[pd.DataFrame]:
     """
-    accept a US formatted dataframe, which could be filtered by state
+    load the datasets, from the binary snapshot unless the csv has changed
     """
-    confirmed_US_sum = pd.Series()
-    deaths_US_sum = pd.Series()
+    source = source or SOURCE
+    hashes = hashes or source.hashes()
+    return [snapshot.update(path, sha1=hashes[name])[0] for name, path in source.paths().items()]
 
-    for column in confirmed_US:
-        try:
-            confirmed_US_sum[column] = int(confirmed_US[column].sum())
-            deaths_US_sum[column] = int(deaths_US[column].sum())
 
-        except Exception as e:
-            confirmed_US_sum[column] = ""
-            deaths_US_sum[column] = ""
-    
-    # Need to reformat it a bit
-    try:
-        confirmed_US_sum = confirmed_US_sum.drop(['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2', 'Province_State', 'Country_Region', 'Lat', 'Long_', 'Combined_Key'])
-        deaths_US_sum = deaths_US_sum.drop(['UID', 'iso2', 'iso3', 'code3', 'FIPS', 'Admin2', 'Province_State', 'Country_Region', 'Lat', 'Long_', 'Combined_Key'])
-    except:
-        # already done
-        pass
-
-    confirmed_US_sum['Province/State'] = ""
-    confirmed_US_sum['Country/Region'] = state
-    confirmed_US_sum['Lat'] = 0
-    confirmed_US_sum['Long'] = 0    
-    deaths_US_sum['Province/State'] = ""
-    deaths_US_sum['Country/Region'] = state
-    deaths_US_sum['Lat'] = 0
-    deaths_US_sum['Long'] = 0
-
-    # format to df and reorder the columns
-    us_deaths = deaths_US_sum.to_frame().T
-    us_deaths = us_deaths[deaths.columns]
-    us_confirmed = confirmed_US_sum.to_frame().T
-    us_confirmed = us_confirmed[confirmed.columns]
-
-    # merge the datasets
+def read_us(confirmed_US: pd.DataFrame, deaths_US: pd.DataFrame, counties: bool = False):
+    """
+    sum the US dataset by state in one pass, or by county (Admin2) within each state
+    returns confirmed and deaths in the global format: the state is the Country/Region and
+    the county, if any, the Province/State
+    """
+    dates = [column for column in confirmed_US.columns if snapshot.is_date(column)]
+    by = ['Province_State', 'Admin2'] if counties else ['Province_State']
+
+    def to_global(df):
+        summed = df.groupby(by)[dates].sum()
+        keys = summed.index.to_frame(index=False)
+        result = pd.DataFrame({
+            'Province/State': keys['Admin2'] if counties else "",
+            'Country/Region': keys['Province_State'],
+            'Lat': 0,
+            'Long': 0,
+        })
+        return pd.concat([result, summed.reset_index(drop=True)], axis=1)
+
+    return to_global(confirmed_US), to_global(deaths_US)
+
+
+def us_populations(deaths_US: pd.DataFrame) -> pd.Series:
+    """
+    population of each state, from the column only the deaths file has
+    """
+    return deaths_US.groupby('Province_State')['Population'].sum()
+
+
+def us_state_names(deaths_US: pd.DataFrame, countries) -> dict:
+    """
+    some states share a name with a country (Georgia), those get " (US)" on the end
+    """
+    return {
+        state: state + " (US)" if state in countries else state
+        for state in deaths_US['Province_State'].unique()
+    }
+
+
+class Dataset:
+    """
+    everything loaded from one version of the source data
+    never modified once built, a refresh builds a new one and swaps it in
+    """
+    def __init__(self, store: locations.LocationStore, country_data: locations.CountryData, version: str, revision: str, built: datetime = None, acceleration: dict = None, alignments: dict = None, projected: dict = None):
+        self.store = store
+        self.country_data = country_data
+        self.version = version
+        # revision of the source, e.g. the CSSE commit
+        self.revision = revision
+        self.dates = store.dates
+        self.built = built or datetime.now()
+        # metric -> acceleration of every location, anchored to the last date in the data
+        if acceleration is None:
+            with metrics.timer("acceleration"):
+                acceleration = analytics.acceleration(store)
+        self.acceleration = acceleration
+        # criterion -> analytics.alignment, the default is always there, others are added when first asked for
+        self.alignments = dict(alignments or {})
+        self.alignments_lock = threading.Lock()
+        if analytics.DEFAULT_START not in self.alignments:
+            with metrics.timer("alignment"):
+                self.alignments[analytics.DEFAULT_START] = analytics.alignment(store)
+        # model -> metric -> projections.BANDS of the next projections.HORIZON days of every location
+        if projected is None:
+            with metrics.timer("projections"):
+                projected = projections.project(store)
+        self.projected = projected
+        self.projected_dates = projections.dates(store)
+        # sorted views of every location and the summary table rows
+        with metrics.timer("rankings"):
+            self.rankings = rankings.Rankings(self)
+
+    def aligned(self, criterion: str = analytics.DEFAULT_START) -> dict:
+        """
+        "offsets" -> outbreak start day of every location, metric -> normalised matrix
+        lined up on the start, so row[k] is k days since the start
+        """
+        alignment = self.alignments.get(criterion)
+        if alignment is None:
+            with self.alignments_lock:
+                alignment = self.alignments.get(criterion)
+                if alignment is None:
+                    alignment = self.alignments[criterion] = analytics.alignment(self.store, criterion)
+        return alignment
+
+    def since_start(self, location: str, metric: str = "deaths", criterion: str = analytics.DEFAULT_START) -> np.ndarray:
+        """
+        a location's normalised series from its outbreak start on, a view not a copy
+        """
+        alignment = self.aligned(criterion)
+        row = self.row(location)
+        return alignment[metric][row, :len(self.dates) - alignment["offsets"][row]]
+
+    def projection(self, location: str, metric: str = "deaths", model: str = projections.DEFAULT_MODEL) -> np.ndarray:
+        """
+        a location's projected cumulative count, projections.BANDS x projections.HORIZON days
+        """
+        return self.projected[model][metric][self.row(location)]
+
+    def nbytes(self) -> int:
+        """
+        memory used by the arrays, the bulk of the dataset
+        """
+        arrays = list(self.store.counts.values()) + list(self.store.normalised.values()) + list(self.acceleration.values())
+        arrays += [array for alignment in list(self.alignments.values()) for array in alignment.values()]
+        arrays += [array for model in self.projected.values() for array in model.values()]
+        return sum(array.nbytes for array in arrays) + self.store.populations.nbytes
+
+    def row(self, location: str) -> int:
+        """
+        row of a COUNTRY_DATA name in the store's matrices
+        """
+        return self.store.index[self.country_data.locations[location]]
+
+
+def build_dataset(previous: Dataset = None, source: sources.Source = None) -> Dataset:
+    """
+    build a complete new dataset
+    the previous dataset is returned as is if nothing changed, without reading anything
+    """
+    source = source or SOURCE
+    start = time.perf_counter()
+    hashes = source.hashes()
+    version = source.version()
+    if DAILY_REPORTS:
+        version = hashlib.sha1(f"{version} {daily_reports.latest(DAILY_REPORTS)}".encode()).hexdigest()[:12]
+    if previous is not None and previous.version == version:
+        return previous
+
+    with metrics.timer("load"):
+        frames = read_sources(source, hashes)
+    confirmed, deaths, recovered, confirmed_US, deaths_US = frames
+
+    # load in US state data, every state as if it were a country
+    names = us_state_names(deaths_US, set(confirmed['Country/Region']))
+    with metrics.timer("read_us"):
+        us_confirmed, us_deaths = read_us(confirmed_US, deaths_US)
+    us_confirmed['Country/Region'] = us_confirmed['Country/Region'].map(names)
+    us_deaths['Country/Region'] = us_deaths['Country/Region'].map(names)
     confirmed = pd.concat([confirmed, us_confirmed], ignore_index=True)
-    deaths = pd.concat([deaths, us_deaths], ignore_index=True)    
-    return confirmed, deaths
+    deaths = pd.concat([deaths, us_deaths], ignore_index=True)
+
+    # cruise ships and the like have no population
+    known = {(names[state], ""): people for state, people in us_populations(deaths_US).items() if people > 0}
+
+    # every location in one matrix per metric
+    with metrics.timer("build_store"):
+        store = locations.build_store(confirmed, deaths, recovered, known)
+    if DAILY_REPORTS:
+        # only the days not already folded in are read, see daily_reports.py
+        # they are extra detail, a bad daily file mustn't stop the time series being served
+        try:
+            with metrics.timer("daily_reports"):
+                reports = daily_reports.DailyReports()
+                reports.ingest(DAILY_REPORTS)
+                if reports.keys:
+                    store = daily_reports.merge(store, reports.store())
+        except Exception:
+            logging.exception("daily reports ingest failed, building from the time series alone")
 
+    dataset = Dataset(store, locations.CountryData(store), version, source.revision())
+    metrics.registry.set("covid_dataset_build_seconds", time.perf_counter() - start)
+    return dataset
 
-# load in US state data
-states = ["New York"]
-for state in states:
-    confirmed, deaths = read_us(confirmed_US[confirmed_US["Province_State"] == state], deaths_US[deaths_US["Province_State"] == state], state)
+
+def swap(dataset: Dataset):
+    """
+    make dataset the one used by everything, a single assignment so readers never see half of one
+    """
+    global DATASET, COUNTRY_DATA
+    DATASET = dataset
+    COUNTRY_DATA = dataset.country_data
 
 
-def load(country: str, state: str) -> pd.DataFrame:
+def ingest() -> Dataset:
     """
-    returns a country as a pandas dataframes with confirmed, deaths, recovered as columns, dates as index
+    incremental refresh: sync the source and parse only the new date columns (see snapshot.update),
+    the dataset itself is rebuilt from the whole matrices
     """
-    # could do the following as a loop but eh
+    SOURCE.sync()
+    previous = globals().get("DATASET")
+    dataset = build_dataset(previous)
+    if dataset is not previous:
+        swap(dataset)
+    return dataset
+
+
+# the current data is only loaded when something first asks for it, see load
+load_lock = threading.Lock()
 
-    # confirmed
-    country_df = confirmed[confirmed['Country/Region'] == country].replace(np.nan, "")
-    state_df = country_df[country_df['Province/State'] == state]
-    confirmed_result = state_df.drop(['Province/State', 'Country/Region', 'Lat', 'Long'], axis=1).T
 
-    # deaths
-    country_df = deaths[deaths['Country/Region'] == country].replace(np.nan, "")
-    state_df = country_df[country_df['Province/State'] == state]
-    deaths_result = state_df.drop(['Province/State', 'Country/Region', 'Lat', 'Long'], axis=1).T
+def reset_locks():
+    """
+    in a forked child (render_pool), locks held by other threads of the parent at the fork stay held
+    """
+    global load_lock
+    load_lock = threading.Lock()
+    if "DATASET" in globals():
+        DATASET.alignments_lock = threading.Lock()
+
 
-    # recovered
-    # try except to deal with US states without recovered data
-    try:
-        country_df = recovered[recovered['Country/Region'] == country].replace(np.nan, "")
-        state_df = country_df[country_df['Province/State'] == state]
-        recovered_result = state_df.drop(['Province/State', 'Country/Region', 'Lat', 'Long'], axis=1).T
-        recovered_result[0]
-    except:
-        recovered_result = deaths_result
+os.register_at_fork(after_in_child=reset_locks)
 
-    # combine the series to one dataframe
-    df_result = pd.concat([confirmed_result, deaths_result, recovered_result], axis =1)
-    df_result.columns = ["confirmed", "deaths", "recovered"]
-    df_result.index = pd.to_datetime(df_result.index)
 
-    return df_result
+def load(sync: bool = False) -> Dataset:
+    """
+    build the dataset if there isn't one yet, syncing the source first (git pull) if sync
+    """
+    with load_lock:
+        if "DATASET" not in globals():
+            if sync:
+                SOURCE.sync()
+            swap(build_dataset())
+    return DATASET
 
 
-# load the data for each country into the dictionary
-for country in COUNTRY_DATA.keys():
-    # get the data
-    df = load(country, COUNTRY_DATA[country]['province'])
-    COUNTRY_DATA[country]['data'] = df
-    # Normalise data with population figures
-    normalise = lambda x: x/COUNTRY_DATA[country]['population'] * 100
-    COUNTRY_DATA[country]['normalised_data'] = df.apply(normalise)
+def current() -> Dataset:
+    """
+    the dataset in use, loaded the first time
+    """
+    return globals().get("DATASET") or load()
 
 
-# Now we have normalised death values, we need normalised dates. We should only compare counties from the date the virus started killing
-# Find the first day of a death for each country
-first_day = lambda df: df.deaths[df.deaths <= 0.0001].index[-1]
-# need to convert the index to days since the first day
-convert_index = lambda df: df[df.index >= first_day(df)].reset_index()
+def __getattr__(name):
+    # plot.DATASET and plot.COUNTRY_DATA load the data on first use
+    if name in ("DATASET", "COUNTRY_DATA"):
+        load()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 """
 Start graph generation functions
 """
 
-def deaths_since_start(countries: List[str]):
+def deaths_since_start(countries: List[str], dataset: Dataset = None):
     """
     Plot of deaths as a percentage of population vs days since spread start
     """
+    import bokeh.models
+    from bokeh.palettes import Colorblind as palette
+    from bokeh.plotting import figure, ColumnDataSource
+
+    dataset = dataset or current()
     # plot an interactive version using bokeh
     colours = cycle(palette[8])
 
@@ -236,14 +303,14 @@ def deaths_since_start(countries: List[str]):
     hover.mode = 'mouse'
 
     for country in countries:
-        # convert to days since start 
-        series = convert_index(COUNTRY_DATA[country]['normalised_data']).deaths
-        label = country + " " + COUNTRY_DATA[country]['province']
+        # days since start, worked out when the dataset was built
+        series = dataset.since_start(country)
+        label = country
         # create a bokeh data source
         source = ColumnDataSource({
-            'x' : series.index,
-            'y' : series.values,
-            'name' : [label for x in series.index],
+            'x' : np.arange(len(series)),
+            'y' : series,
+            'name' : [label for x in series],
         })
 
         fig.line(
@@ -258,17 +325,49 @@ def deaths_since_start(countries: List[str]):
     return fig
 
 
-def deaths_since_start_mobile(countries: List[str]):
+def deaths_since_start_document():
+    """
+    The bokeh plot of deaths_since_start with no data in it, the same for every page
+    The page fetches the series from /api/series and fills in the "series" data source
+    """
+    import bokeh.models
+    from bokeh.plotting import figure, ColumnDataSource
+
+    fig = figure(
+        x_axis_label='Days since deaths started in each country', 
+        y_axis_label='Percentage of the population',
+        plot_width=800,
+        plot_height=500,
+        id="plot_1",
+        active_drag="pan",
+        active_scroll="wheel_zoom",
+        )
+
+    fig.add_tools(bokeh.models.HoverTool())
+    hover = fig.select(dict(type=bokeh.models.HoverTool))
+    hover.tooltips = [("Country", "@name"), ("Day", "$x{0}"),  ("Value", "$y"),]
+    hover.mode = 'mouse'
+
+    source = ColumnDataSource({'xs': [], 'ys': [], 'name': [], 'colour': []}, name="series")
+    fig.multi_line('xs', 'ys', source=source, legend_field='name', line_width=2, color='colour')
+
+    return fig
+
+
+def deaths_since_start_mobile(countries: List[str], dataset: Dataset = None):
     """
     Matplotlib version of bokeh plot
     """
+    from matplotlib.figure import Figure
+
+    dataset = dataset or current()
     fig = Figure(figsize=(10,6))
     ax = fig.add_subplot(1, 1, 1)
 
     for country in countries:
-        ax.plot(convert_index(COUNTRY_DATA[country]['normalised_data']).deaths)
+        ax.plot(dataset.since_start(country))
     
-    ax.legend([country + " " + COUNTRY_DATA[country]['province'] for country in countries])
+    ax.legend(countries)
     ax.set_xlim([0, 40])
     ax.set_xlabel("Days since spread started in each country")
     ax.set_ylabel("Percentage of the population")
@@ -280,31 +379,57 @@ def deaths_since_start_mobile(countries: List[str]):
     return fig
 
 
-@lru_cache()
-def acceleration(country):
+def deaths_projection_plot(countries: List[str], dataset: Dataset = None, model: str = projections.DEFAULT_MODEL):
+    """
+    deaths as a percentage of the population over the days fitted, then the projection
+    dashed with its band shaded, day 0 is the last day of the data
+    """
+    from matplotlib.figure import Figure
+
+    dataset = dataset or current()
+    fig = Figure(figsize=(10,6))
+    ax = fig.add_subplot(1, 1, 1)
+
+    for i, country in enumerate(countries):
+        row = dataset.row(country)
+        population = dataset.store.populations[row]
+        history = dataset.store.normalised["deaths"][row, -projections.FIT_WINDOW:]
+        projected = dataset.projection(country, "deaths", model) / population * 100
+        # joined on to the last real day
+        central, lower, upper = np.concatenate([np.full((3, 1), history[-1]), projected], axis=1)
+        past = np.arange(1 - len(history), 1)
+        future = np.arange(0, projections.HORIZON + 1)
+
+        ax.plot(past, history, color=f"C{i % 10}", label=country)
+        ax.plot(future, central, color=f"C{i % 10}", linestyle="--")
+        ax.fill_between(future, lower, upper, color=f"C{i % 10}", alpha=0.2, linewidth=0)
+
+    ax.axvline(0, color="#7f7f7f", linestyle=":")
+    ax.legend()
+    ax.set_xlim([1 - projections.FIT_WINDOW, projections.HORIZON])
+    ax.set_xlabel("Days from the latest data")
+    ax.set_ylabel("Percentage of the population")
+
+    return fig
+
+
+def acceleration(country, dataset: Dataset = None):
     """
     get the accelation of deaths and confimred cases for a country
+    computed for every country when the dataset is built, this is just a lookup
     """
-    # confirmed
-    df = COUNTRY_DATA[country]['data'].confirmed.diff()
-    df = df[df.index > (pd.Timestamp.now() - pd.Timedelta(days=8))]
-    bestfit = np.polyfit(x=range(len(df.values)), y=df.values, deg=1)
-    confirmed_gradient = bestfit[0] / COUNTRY_DATA[country]['population']
-    
-    # deaths
-    df = COUNTRY_DATA[country]['data'].deaths.diff()
-    df = df[df.index > (pd.Timestamp.now() - pd.Timedelta(days=8))]
-    bestfit = np.polyfit(x=range(len(df.values)), y=df.values, deg=1)
-    deaths_gradient = bestfit[0] / COUNTRY_DATA[country]['population']
-    
-    return confirmed_gradient, deaths_gradient
+    dataset = dataset or current()
+    row = dataset.row(country)
+    return dataset.acceleration["confirmed"][row], dataset.acceleration["deaths"][row]
 
 
-def acceleration_deaths_plot(countries: List[str]):
+def acceleration_deaths_plot(countries: List[str], dataset: Dataset = None):
     # make bar charts with accerlation/sum for confirmed/deaths for each country
     # do with matplotlib as bokeh is being a bitch
     # stacked example
-    deaths_accel = [acceleration(country)[1] for country in countries]
+    from matplotlib.figure import Figure
+
+    deaths_accel = [acceleration(country, dataset)[1] for country in countries]
     
     # sort in acceleration order
     sorted_countries = [x for _,x in sorted(zip(deaths_accel, countries), reverse=True)]
@@ -338,7 +463,9 @@ def acceleration_deaths_plot(countries: List[str]):
     return fig
 
 
-def acceleration_confirmed_plot(countries: List[str]):
+def acceleration_confirmed_plot(countries: List[str], dataset: Dataset = None):
+    from matplotlib.figure import Figure
+
     fig = Figure()
     axis = fig.add_subplot(1, 1, 1)
 
@@ -346,7 +473,7 @@ def acceleration_confirmed_plot(countries: List[str]):
     barWidth = 0.8
     
     # set height of bar
-    confirmed_accel = [acceleration(country)[0] for country in countries]
+    confirmed_accel = [acceleration(country, dataset)[0] for country in countries]
 
     # sort in acceleration order
     sorted_countries = [x for _,x in sorted(zip(confirmed_accel, countries), reverse=True)]
@@ -376,33 +503,16 @@ def acceleration_confirmed_plot(countries: List[str]):
     return fig
 
 
-def summary_table(countries: List[str]):
+def summary_table(countries: List[str], dataset: Dataset = None):
     """
     Total confirmed, total deaths, acceleration absolute
+    the rows are made once per dataset, see rankings.py
     """
-    
-    df_list = []
-    
-    for country in countries:
-        acceleration_figures = acceleration(country)
-        pop = COUNTRY_DATA[country]['population']
-        df_list.append(
-            [
-                country,
-                COUNTRY_DATA[country]['data'].confirmed[-1],
-                int(acceleration_figures[0] * pop),
-                COUNTRY_DATA[country]['data'].deaths[-1],
-                int(acceleration_figures[1] * pop),
-            ]
-        )
-
-    return df_list
+    return (dataset or current()).rankings.rows(countries)
 
 
-def sorted_countries():
+def sorted_countries(dataset: Dataset = None):
     """
     return list of countries sorted by number of deaths
     """
-    ahh = [(country, COUNTRY_DATA[country]['data'].deaths[-1]) for country in COUNTRY_DATA.keys()]
-    sorted_countries = sorted(ahh, key=lambda x: x[1], reverse=True)
-    return [data[0] for data in sorted_countries]
\ No newline at end of file
+    return (dataset or current()).rankings.ranked("deaths")
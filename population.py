@@ -0,0 +1,98 @@
+"""
+Population registry
+
+2016 populations from population_figures.csv (World Bank names) matched up with the
+CSSE Country/Region names, plus overrides for provinces the file doesn't cover and
+for countries where we have more recent figures.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+POPULATION_FILE = "population_figures.csv"
+
+# World Bank name -> CSSE name, where they differ
+ALIASES = {
+    "United States": "US",
+    "Korea, Rep.": "Korea, South",
+    "Iran, Islamic Rep.": "Iran",
+    "Russian Federation": "Russia",
+    "Egypt, Arab Rep.": "Egypt",
+    "Bahamas, The": "Bahamas",
+    "Gambia, The": "Gambia",
+    "Congo, Dem. Rep.": "Congo (Kinshasa)",
+    "Congo, Rep.": "Congo (Brazzaville)",
+    "Venezuela, RB": "Venezuela",
+    "Yemen, Rep.": "Yemen",
+    "Brunei Darussalam": "Brunei",
+    "Czech Republic": "Czechia",
+    "Kyrgyz Republic": "Kyrgyzstan",
+    "Lao PDR": "Laos",
+    "Slovak Republic": "Slovakia",
+    "Syrian Arab Republic": "Syria",
+    "Macedonia, FYR": "North Macedonia",
+    "Swaziland": "Eswatini",
+    "Micronesia, Fed. Sts.": "Micronesia",
+    "Myanmar": "Burma",
+    "St. Kitts and Nevis": "Saint Kitts and Nevis",
+    "St. Lucia": "Saint Lucia",
+    "St. Vincent and the Grenadines": "Saint Vincent and the Grenadines",
+    "St. Martin (French part)": "St Martin",
+    "Hong Kong SAR, China": "Hong Kong",
+    "Macao SAR, China": "Macau",
+}
+
+# (country, province) -> population, these win over everything else
+OVERRIDES = {
+    ("United Kingdom", ""): 66440000, #2018
+    ("France", ""): 66990000, #2019
+    ("Germany", ""): 82790000, #2018
+    ("Spain", ""): 46660000, #2018
+    ("Italy", ""): 60480000, #2018
+    ("Poland", ""): 37980000, #2018
+    ("Norway", ""): 5368000, #2020
+    ("Sweden", ""): 10120000, #2018
+    ("China", "Hubei"): 59020000, #2017
+    ("Korea, South", ""): 51470000, #2017
+    ("US", ""): 327200000, #2018
+    ("India", ""): 1339000000, #2017
+    ("Mexico", ""): 129200000, #2017
+    ("Iran", ""): 81160000, #2017
+    ("Netherlands", ""): 17280000, #2019
+}
+
+
+class Registry:
+    def __init__(self, path: str = POPULATION_FILE):
+        df = pd.read_csv(path).dropna()
+        self.figures = {ALIASES.get(name, name): int(population) for name, population in zip(df['Country'], df['Year_2016'])}
+
+    def get(self, country: str, province: str = "", known: Dict[Tuple[str, str], float] = None) -> float:
+        """
+        population of a location, NaN if we don't know it
+        known holds figures from elsewhere (the US file) which beat the 2016 ones
+        """
+        key = (country, province)
+        if key in OVERRIDES:
+            return OVERRIDES[key]
+        if known and key in known:
+            return known[key]
+        # overseas territories are listed under their own name (Gibraltar, Greenland, ...)
+        return self.figures.get(province or country, np.nan)
+
+    def populations(self, keys: List[Tuple[str, str]], known: Dict[Tuple[str, str], float] = None) -> np.ndarray:
+        """
+        populations lined up with a list of (country, province) keys
+        """
+        return np.array([self.get(country, province, known) for country, province in keys], dtype=float)
+
+
+@lru_cache()
+def registry(path: str = POPULATION_FILE) -> Registry:
+    """
+    the file is only read once
+    """
+    return Registry(path)
@@ -0,0 +1,203 @@
+"""
+Projections of every location's confirmed cases and deaths, fitted once per dataset
+
+Each model is fitted to the last FIT_WINDOW days of every location and carried HORIZON
+days past the end of the data, with a 95% band:
+    log_linear - a straight line through the log of the daily new count (7 day average),
+                 closed form, one matrix product for every location at once
+    logistic   - K / (1 + exp(-r (t - t0))) through the cumulative count
+    gompertz   - K exp(-b exp(-r t)) through the cumulative count
+The two curves are fitted by Levenberg-Marquardt, every location at once as stacked 3x3
+systems, with the locations split into chunks over a process pool. Their bands come from
+the parameter covariance of the fit, pushed through the curve (the delta method).
+
+The result is model -> metric -> array of locations x BANDS x HORIZON days of the
+cumulative count, lined up with store.keys.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+
+from locations import LocationStore
+
+MODELS = ["log_linear", "logistic", "gompertz"]
+DEFAULT_MODEL = "log_linear"
+METRICS = ["confirmed", "deaths"]
+BANDS = ["central", "lower", "upper"]
+
+# days fitted over and days projected
+FIT_WINDOW = 28
+HORIZON = 14
+# days the daily counts are averaged over for the log linear fit
+SMOOTHING = 7
+# normal quantile of the band, 95%
+Z = 1.96
+
+# curve fitting
+ITERATIONS = 60
+PROCESSES = 4
+# locations per job sent to the pool, anything smaller is fitted in process
+CHUNK_ROWS = 256
+
+
+def dates(store: LocationStore) -> pd.DatetimeIndex:
+    """
+    the days a projection covers, the day after the data ends onwards
+    """
+    return pd.date_range(store.dates[-1] + pd.Timedelta(days=1), periods=HORIZON)
+
+
+# log linear
+
+def log_linear(counts: np.ndarray) -> np.ndarray:
+    """
+    locations x dates cumulative counts -> locations x BANDS x HORIZON
+    """
+    window = counts[:, -(FIT_WINDOW + SMOOTHING):].astype(float)
+    # moving average of the daily counts, FIT_WINDOW of them, the cumulative counts are already its running sum
+    smoothed = np.maximum((window[:, SMOOTHING:] - window[:, :-SMOOTHING]) / SMOOTHING, 0)
+    y = np.log1p(smoothed)
+
+    days = y.shape[1]
+    x = np.arange(days, dtype=float)
+    mean = x.mean()
+    x -= mean
+    sxx = x @ x
+    slope = y @ x / sxx
+    intercept = y.mean(axis=1)
+    residuals = y - intercept[:, None] - slope[:, None] * x[None, :]
+    sigma = np.sqrt((residuals ** 2).sum(axis=1) / max(days - 2, 1))
+
+    # prediction interval of each future day
+    future = np.arange(days, days + HORIZON) - mean
+    predicted = intercept[:, None] + slope[:, None] * future[None, :]
+    spread = Z * sigma[:, None] * np.sqrt(1 + 1 / days + future ** 2 / sxx)[None, :]
+
+    last = window[:, -1:]
+    result = np.empty((len(counts), len(BANDS), HORIZON))
+    for band, log_daily in enumerate([predicted, predicted - spread, predicted + spread]):
+        # capped, a steep line carried two weeks goes silly quickly
+        daily = np.expm1(np.clip(log_daily, 0, 30))
+        result[:, band] = last + np.cumsum(daily, axis=1)
+    return result
+
+
+# curves, t is days relative to the last day of the data
+
+def logistic(t: np.ndarray, p: np.ndarray):
+    """
+    values and jacobian (K, r, t0) of every location's curve at t
+    """
+    K, r, t0 = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    e = np.exp(np.clip(-r * (t - t0), -50, 50))
+    d = 1 + e
+    f = K / d
+    jacobian = np.stack([1 / d, K * (t - t0) * e / d ** 2, -K * r * e / d ** 2], axis=2)
+    return f, jacobian
+
+
+def gompertz(t: np.ndarray, p: np.ndarray):
+    """
+    values and jacobian (K, b, r) of every location's curve at t
+    """
+    K, b, r = p[:, 0:1], p[:, 1:2], p[:, 2:3]
+    u = np.exp(np.clip(-r * t, -50, 50))
+    g = np.exp(np.clip(-b * u, -50, 50))
+    f = K * g
+    jacobian = np.stack([g, -K * g * u, K * g * b * t * u], axis=2)
+    return f, jacobian
+
+
+# both start out with the curve through today's count at half its final size, growing 10% a day
+CURVES = {
+    "logistic": (logistic, [2.0, 0.1, 0.0], ([1.0, 1e-4, -100.0], [1e3, 2.0, 300.0])),
+    "gompertz": (gompertz, [2.0, np.log(2), 0.1], ([1.0, 1e-4, 1e-4], [1e3, 1e3, 2.0])),
+}
+
+
+def fit_curve(model: str, y: np.ndarray) -> np.ndarray:
+    """
+    runs in a worker
+    y is locations x FIT_WINDOW, scaled so the last day is 1
+    returns locations x BANDS x HORIZON, still scaled
+    """
+    curve, initial, (low, high) = CURVES[model]
+    low, high = np.array(low), np.array(high)
+    n, days = y.shape
+    t = np.arange(1 - days, 1, dtype=float)[None, :]
+    p = np.tile(np.array(initial, dtype=float), (n, 1))
+    damping = np.full(n, 1e-2)
+    eye = np.eye(len(initial))
+
+    f, jacobian = curve(t, p)
+    error = ((y - f) ** 2).sum(axis=1)
+    for _ in range(ITERATIONS):
+        jtj = jacobian.transpose(0, 2, 1) @ jacobian
+        gradient = jacobian.transpose(0, 2, 1) @ (y - f)[:, :, None]
+        system = jtj + damping[:, None, None] * jtj * eye + 1e-9 * eye
+        step = np.linalg.solve(system, gradient)[:, :, 0]
+        trial = np.clip(p + step, low, high)
+        f_trial, jacobian_trial = curve(t, trial)
+        error_trial = ((y - f_trial) ** 2).sum(axis=1)
+
+        better = error_trial < error
+        p[better], f[better], jacobian[better], error[better] = trial[better], f_trial[better], jacobian_trial[better], error_trial[better]
+        damping = np.where(better, damping / 3, damping * 3)
+
+    # parameter covariance, then the variance of each projected day plus the noise
+    variance = error / max(days - len(initial), 1)
+    covariance = variance[:, None, None] * np.linalg.pinv(jacobian.transpose(0, 2, 1) @ jacobian)
+    future = np.arange(1, HORIZON + 1, dtype=float)[None, :]
+    projected, future_jacobian = curve(future, p)
+    spread = Z * np.sqrt(np.einsum("nhi,nij,nhj->nh", future_jacobian, covariance, future_jacobian) + variance[:, None])
+
+    return np.stack([projected, projected - spread, projected + spread], axis=1)
+
+
+def curves(model: str, counts: np.ndarray, pool: ProcessPoolExecutor = None) -> np.ndarray:
+    """
+    locations x dates cumulative counts -> locations x BANDS x HORIZON
+    the chunks are fitted in pool if there is one
+    """
+    window = counts[:, -FIT_WINDOW:].astype(float)
+    last = window[:, -1:]
+    scale = np.maximum(last, 1)
+    y = window / scale
+
+    chunks = [y[i:i + CHUNK_ROWS] for i in range(0, len(y), CHUNK_ROWS)]
+    if pool is not None and len(chunks) > 1:
+        results = list(pool.map(fit_curve, [model] * len(chunks), chunks))
+    else:
+        results = [fit_curve(model, chunk) for chunk in chunks]
+    result = np.concatenate(results) if results else np.zeros((0, len(BANDS), HORIZON))
+
+    # a cumulative count never goes down
+    return np.maximum(result * scale[:, :, None], last[:, :, None])
+
+
+def project(store: LocationStore, processes: int = PROCESSES) -> Dict[str, Dict[str, np.ndarray]]:
+    """
+    every model and metric for every location, see the top of the file
+    """
+    # one pool for all of the curve fits, and only when there is more than a chunk to fit
+    # and more than one cpu to fit it on
+    processes = min(processes, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(processes) if processes > 1 and len(store.keys) > CHUNK_ROWS else None
+    try:
+        result = {}
+        for model in MODELS:
+            result[model] = {}
+            for metric in METRICS:
+                counts = store.counts[metric]
+                if model == "log_linear":
+                    result[model][metric] = log_linear(counts)
+                else:
+                    result[model][metric] = curves(model, counts, pool)
+        return result
+    finally:
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,89 @@
+"""
+Rankings of every location, worked out once per dataset
+
+Each ranking is an index array sorting the locations by one figure. The summary table rows
+are built once as well, so a page of the table (or the whole of it) is a slice of an
+index array and a list lookup per row.
+"""
+
+from typing import List
+
+import numpy as np
+
+# the summary table, in the order of the columns on the page
+COLUMNS = ["location", "confirmed", "confirmed_acceleration", "deaths", "deaths_acceleration"]
+
+SORTS = [
+    "deaths",
+    "confirmed",
+    "deaths_acceleration",
+    "confirmed_acceleration",
+    "deaths_per_capita",
+    "confirmed_per_capita",
+]
+DEFAULT_SORT = "deaths"
+
+
+class Rankings:
+    def __init__(self, dataset):
+        # every location with a population, in COUNTRY_DATA order
+        self.names = list(dataset.country_data.keys())
+        rows = np.array([dataset.row(name) for name in self.names], dtype=np.int64)
+        store = dataset.store
+        populations = store.populations[rows]
+
+        values = {
+            "confirmed": store.counts["confirmed"][rows, -1],
+            "deaths": store.counts["deaths"][rows, -1],
+            # absolute, new cases a day per day
+            "confirmed_acceleration": dataset.acceleration["confirmed"][rows] * populations,
+            "deaths_acceleration": dataset.acceleration["deaths"][rows] * populations,
+            "confirmed_per_capita": store.normalised["confirmed"][rows, -1],
+            "deaths_per_capita": store.normalised["deaths"][rows, -1],
+        }
+
+        # biggest first, ties stay in COUNTRY_DATA order
+        self.order = {}
+        for sort in SORTS:
+            keys = np.nan_to_num(values[sort].astype(float), nan=-np.inf)
+            self.order[sort] = np.argsort(-keys, kind="stable")
+
+        self.table = [
+            [name, int(confirmed), int(confirmed_acceleration), int(deaths), int(deaths_acceleration)]
+            for name, confirmed, confirmed_acceleration, deaths, deaths_acceleration in zip(
+                self.names,
+                values["confirmed"],
+                np.nan_to_num(values["confirmed_acceleration"]),
+                values["deaths"],
+                np.nan_to_num(values["deaths_acceleration"]),
+            )
+        ]
+        self.position = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def indices(self, sort: str = DEFAULT_SORT, descending: bool = True, offset: int = 0, limit: int = None) -> np.ndarray:
+        order = self.order[sort]
+        if not descending:
+            order = order[::-1]
+        end = None if limit is None else offset + limit
+        return order[offset:end]
+
+    def ranked(self, sort: str = DEFAULT_SORT, descending: bool = True, offset: int = 0, limit: int = None) -> List[str]:
+        """
+        location names in order
+        """
+        return [self.names[i] for i in self.indices(sort, descending, offset, limit)]
+
+    def page(self, sort: str = DEFAULT_SORT, descending: bool = True, offset: int = 0, limit: int = None) -> List[list]:
+        """
+        summary table rows in order, see COLUMNS
+        """
+        return [self.table[i] for i in self.indices(sort, descending, offset, limit)]
+
+    def rows(self, names: List[str]) -> List[list]:
+        """
+        summary table rows of the given locations, in the order given
+        """
+        return [self.table[self.position[name]] for name in names]
@@ -0,0 +1,99 @@
+"""
+Background data refresh
+
+A refresh pulls the CSSE repo and builds a complete new plot.Dataset off the request
+thread, then swaps it in with one assignment. Requests keep using the old dataset
+until then, so they never see a half built one.
+"""
+
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import plot
+
+
+class Refresher:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_success = None
+        self.last_duration = None
+        self.last_error = None
+        self.listeners = []
+
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def on_refresh(self, listener, first: bool = False):
+        """
+        call listener() every time a refresh swaps in new data
+        """
+        if first:
+            self.listeners.insert(0, listener)
+        else:
+            self.listeners.append(listener)
+
+    def trigger(self) -> bool:
+        """
+        start a refresh in the background, returns False if one is already running
+        """
+        with self.lock:
+            if self.running():
+                return False
+            self.thread = threading.Thread(target=self.refresh, name="refresh", daemon=True)
+            self.thread.start()
+            return True
+
+    def refresh(self):
+        start = time.perf_counter()
+        previous = plot.DATASET
+        try:
+            dataset = plot.ingest()
+        except Exception as e:
+            self.last_error = f"{datetime.now():%Y-%m-%d %H:%M:%S} {e!r}"
+            metrics.registry.inc("covid_refreshes_total", result="error")
+            return
+        self.last_duration = time.perf_counter() - start
+        self.last_success = datetime.now()
+        metrics.registry.set("covid_refresh_seconds", self.last_duration)
+        metrics.registry.inc("covid_refreshes_total", result="changed" if dataset is not previous else "unchanged")
+
+        if dataset is not previous:
+            self.notify()
+
+    def notify(self):
+        """
+        tell the listeners new data has been swapped in
+        """
+        for listener in self.listeners:
+            listener()
+
+    def schedule(self, interval: float):
+        """
+        refresh every interval seconds, forever
+        """
+        def loop():
+            while True:
+                time.sleep(interval)
+                self.trigger()
+
+        threading.Thread(target=loop, name="refresh-schedule", daemon=True).start()
+
+    def state(self) -> dict:
+        dataset = plot.DATASET
+        return {
+            "running": self.running(),
+            "last_success": self.last_success.strftime("%Y-%m-%d %H:%M:%S") if self.last_success else None,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "version": dataset.version,
+            "source": repr(plot.SOURCE),
+            "source_revision": dataset.revision,
+            "last_date": dataset.dates[-1].strftime("%Y-%m-%d"),
+            "built": dataset.built.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+refresher = Refresher()
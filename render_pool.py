@@ -0,0 +1,128 @@
+"""
+Render charts in a pool of worker processes, so drawing isn't stuck on one core behind the GIL
+
+Workers are forked once the data is loaded, so they share the parent's dataset
+(copy on write) instead of loading their own. The pool is re-forked whenever new
+data is swapped in. Only the chart spec goes to a worker and only png bytes come back.
+If the queue is full or a render takes too long the last image drawn for the same
+chart, or failing that a placeholder, is returned instead.
+"""
+
+import io
+import multiprocessing
+import platform
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from typing import List, Tuple
+
+import cache
+import charts
+import plot
+
+# defaults, see RenderPool
+PROCESSES = 4
+QUEUE_SIZE = 32
+TIMEOUT = 10
+LAST_GOOD_BYTES = 32 * 1024 * 1024
+
+
+class StaleDataset(Exception):
+    pass
+
+
+def _render(endpoint: str, countries: List[str], version: str, size: Tuple[float, float]) -> bytes:
+    """
+    runs in a worker
+    """
+    dataset = plot.DATASET
+    if dataset.version != version:
+        raise StaleDataset(version)
+    return charts.render(endpoint, countries, dataset, size)
+
+
+def _started() -> bool:
+    """
+    runs in a worker, a no-op to make the pool fork its workers
+    """
+    return True
+
+
+def placeholder() -> bytes:
+    from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 7))
+    fig.text(0.5, 0.5, "Chart is busy, try again in a moment", ha="center", va="center", fontsize=18)
+    output = io.BytesIO()
+    FigureCanvas(fig)
+    fig.savefig(output, format="png")
+    return output.getvalue()
+
+
+class RenderPool:
+    def __init__(self, processes: int = PROCESSES, queue_size: int = QUEUE_SIZE, timeout: float = TIMEOUT):
+        self.processes = processes
+        self.timeout = timeout
+        # bounds the number of renders queued or running at once
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.lock = threading.Lock()
+        # last image drawn for each chart, whatever the data version
+        self.last_good = cache.ByteCache(LAST_GOOD_BYTES)
+        self.placeholder = None
+        self.executor = None
+        self.restart()
+
+    def restart(self):
+        """
+        fork a fresh set of workers holding the current dataset
+        """
+        # fork shares the loaded dataset, spawn (Windows) has to load it again in each worker
+        method = "spawn" if platform.system() == "Windows" else "fork"
+        executor = ProcessPoolExecutor(self.processes, mp_context=multiprocessing.get_context(method))
+        # workers are only forked on the first submit, do it now rather than from a request thread
+        for started in [executor.submit(_started) for _ in range(self.processes)]:
+            started.result()
+        with self.lock:
+            old, self.executor = self.executor, executor
+        if old is not None:
+            # anything already queued on the old workers still finishes
+            old.shutdown(wait=False)
+
+    def fallback(self, key) -> bytes:
+        image = self.last_good.get(key)
+        if image is None:
+            if self.placeholder is None:
+                self.placeholder = placeholder()
+            image = self.placeholder
+        return image
+
+    def render(self, endpoint: str, countries: List[str], dataset: plot.Dataset, size: Tuple[float, float] = None) -> Tuple[bytes, bool]:
+        """
+        png bytes of a chart, drawn by a worker
+        also returns False if they are a stand in because the pool was too busy
+        """
+        key = (endpoint, tuple(countries))
+        if not self.slots.acquire(blocking=False):
+            return self.fallback(key), False
+        try:
+            with self.lock:
+                future = self.executor.submit(_render, endpoint, countries, dataset.version, size)
+        except:
+            self.slots.release()
+            raise
+        # the slot is held until the worker is done, even if we stop waiting for it
+        future.add_done_callback(lambda _: self.slots.release())
+
+        try:
+            image = future.result(self.timeout)
+        except StaleDataset:
+            # the workers haven't been re-forked with this data yet
+            image = charts.render(endpoint, countries, dataset, size)
+        except TimeoutError:
+            return self.fallback(key), False
+
+        self.last_good.put(key, image)
+        return image, True
+
+    def shutdown(self):
+        self.executor.shutdown()
@@ -0,0 +1,195 @@
+"""
+One loaded dataset shared by every server process, through memory mapped files
+
+    python shared.py [directory]        - the loader: load, publish, refresh hourly and publish again
+    gunicorn -w 4 'web:create_app(shared_directory="snapshot/shared")'
+
+The loader writes every array of a plot.Dataset (counts, normalised counts, acceleration,
+populations, outbreak start alignment, projections) as .npy files into directory/<generation>/ with
+the location index and dates alongside, then points directory/generation at it. Workers memory map the arrays
+read only, so the pages are shared between processes by the OS and nothing is parsed
+or computed again. A worker checks the generation at most every CHECK_INTERVAL seconds
+and switches to a new one by mapping its files. A worker started before the loader's
+first generation waits for it (up to WAIT_TIMEOUT), it never loads the data itself.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from os.path import join
+
+import numpy as np
+import pandas as pd
+
+import analytics
+import locations
+import plot
+import snapshot
+from refresh import refresher
+
+SHARED_DIRECTORY = join(snapshot.SNAPSHOT_DIRECTORY, "shared")
+# seconds between a worker checking for a new generation
+CHECK_INTERVAL = 1.0
+# generations kept on disk, workers may still have the older one mapped for a moment
+KEEP_GENERATIONS = 2
+# seconds a starting worker waits for the loader's first generation
+WAIT_TIMEOUT = 600
+
+
+def current_generation(directory: str = SHARED_DIRECTORY) -> int:
+    """
+    the latest published generation, -1 if there isn't one
+    """
+    try:
+        with open(join(directory, "generation")) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return -1
+
+
+def save(path: str, array: np.ndarray):
+    with open(path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+
+
+def publish(dataset: plot.Dataset, directory: str = SHARED_DIRECTORY) -> int:
+    """
+    write dataset as the next generation, returns its number
+    """
+    generation = current_generation(directory) + 1
+    path = join(directory, str(generation))
+    os.makedirs(path, exist_ok=True)
+
+    store = dataset.store
+    for metric in store.counts:
+        save(join(path, f"counts.{metric}.npy"), store.counts[metric])
+        save(join(path, f"normalised.{metric}.npy"), store.normalised[metric])
+    for metric, values in dataset.acceleration.items():
+        save(join(path, f"acceleration.{metric}.npy"), values)
+    save(join(path, "populations.npy"), store.populations)
+    # only the default alignment, any other is worked out by each worker if asked for
+    alignment = dataset.aligned()
+    for name, values in alignment.items():
+        save(join(path, f"aligned.{name}.npy"), values)
+    for model, projected in dataset.projected.items():
+        for metric, values in projected.items():
+            save(join(path, f"projected.{model}.{metric}.npy"), values)
+    with open(join(path, "meta.json"), "w") as f:
+        json.dump({
+            "version": dataset.version,
+            "revision": dataset.revision,
+            "built": dataset.built.isoformat(),
+            "dates": [date.strftime("%Y-%m-%d") for date in dataset.dates],
+            "keys": store.keys,
+            "metrics": list(store.counts),
+            "acceleration": list(dataset.acceleration),
+            "aligned": list(alignment),
+            "projected": {model: list(projected) for model, projected in dataset.projected.items()},
+        }, f)
+
+    # the switch, only once everything is written
+    with open(join(directory, "generation.tmp"), "w") as f:
+        f.write(str(generation))
+    os.replace(join(directory, "generation.tmp"), join(directory, "generation"))
+
+    for old in os.listdir(directory):
+        if old.isdigit() and int(old) <= generation - KEEP_GENERATIONS:
+            shutil.rmtree(join(directory, old), ignore_errors=True)
+    return generation
+
+
+def attach(directory: str = SHARED_DIRECTORY, generation: int = None) -> plot.Dataset:
+    """
+    the dataset of a generation (the latest by default), arrays memory mapped read only
+    """
+    if generation is None:
+        generation = current_generation(directory)
+    path = join(directory, str(generation))
+    with open(join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    def mapped(name):
+        return np.load(join(path, name), mmap_mode="r")
+
+    store = locations.LocationStore(
+        [tuple(key) for key in meta["keys"]],
+        pd.to_datetime(meta["dates"]),
+        {metric: mapped(f"counts.{metric}.npy") for metric in meta["metrics"]},
+        mapped("populations.npy"),
+        normalised={metric: mapped(f"normalised.{metric}.npy") for metric in meta["metrics"]},
+    )
+    return plot.Dataset(
+        store,
+        locations.CountryData(store),
+        meta["version"],
+        meta["revision"],
+        built=datetime.fromisoformat(meta["built"]),
+        acceleration={metric: mapped(f"acceleration.{metric}.npy") for metric in meta["acceleration"]},
+        alignments={analytics.DEFAULT_START: {name: mapped(f"aligned.{name}.npy") for name in meta["aligned"]}},
+        projected={
+            model: {metric: mapped(f"projected.{model}.{metric}.npy") for metric in metrics}
+            for model, metrics in meta["projected"].items()
+        },
+    )
+
+
+def wait(directory: str = SHARED_DIRECTORY, timeout: float = WAIT_TIMEOUT) -> int:
+    """
+    block until the loader has published a generation, returns it
+    a worker never loads the data itself, that would be a git pull and a full build per worker
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        generation = current_generation(directory)
+        if generation >= 0:
+            return generation
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"nothing published in {directory} after {timeout}s, is the loader (python shared.py) running?")
+        time.sleep(CHECK_INTERVAL)
+
+
+class Follower:
+    """
+    keeps a worker on the latest published generation
+    """
+    def __init__(self, directory: str = SHARED_DIRECTORY, interval: float = CHECK_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self.generation = None
+        self.checked = 0.0
+        self.lock = threading.Lock()
+
+    def check(self) -> bool:
+        """
+        cheap enough to call on every request, returns True if a new generation was swapped in
+        """
+        now = time.monotonic()
+        if now - self.checked < self.interval:
+            return False
+        self.checked = now
+
+        generation = current_generation(self.directory)
+        if generation < 0 or generation == self.generation:
+            return False
+        with self.lock:
+            if generation == self.generation:
+                return False
+            plot.swap(attach(self.directory, generation))
+            self.generation = generation
+        # caches and warmup, off the request thread
+        threading.Thread(target=refresher.notify, name="shared-refresh", daemon=True).start()
+        return True
+
+
+if __name__ == '__main__':
+    import sys
+    directory = sys.argv[1] if len(sys.argv) > 1 else SHARED_DIRECTORY
+    plot.load(sync=True)
+    print("published generation", publish(plot.DATASET, directory))
+    refresher.on_refresh(lambda: print("published generation", publish(plot.DATASET, directory)))
+    refresher.schedule(60 * 60)
+    while True:
+        time.sleep(60 * 60)
@@ -0,0 +1,192 @@
+"""
+Columnar binary snapshot of the CSSE time series csv files
+
+Each csv is converted once into
+    <name>.counts.npy   - int32 matrix of counts, locations x dates (memory mapped on load)
+    <name>.locations.csv - the non date columns (the location index)
+    <name>.json          - date axis and the sha1 of the source csv
+
+update() returns the same wide dataframe pd.read_csv would, but only parses the
+csv when its hash no longer matches the snapshot. The files only grow by a date
+column a day, so when they change update() parses just the new columns plus the
+last REVISION_WINDOW days (which CSSE do occasionally revise) and appends them. Older
+revisions aren't seen by that, so every FULL_REBUILD_EVERY incremental updates the whole
+file is parsed again.
+"""
+
+import hashlib
+import json
+import os
+from os.path import basename, join, splitext
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+SNAPSHOT_DIRECTORY = "snapshot"
+
+# number of already ingested days which are re-read on an incremental update
+REVISION_WINDOW = 7
+# incremental updates in a row before the next one is a full reparse, to pick up revisions
+# to days older than REVISION_WINDOW
+FULL_REBUILD_EVERY = 7
+
+
+def file_hash(path: str) -> str:
+    """
+    sha1 of a file, read in blocks so big files don't sit in memory
+    """
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def is_date(column: str) -> bool:
+    """
+    CSSE date columns look like 1/22/20
+    """
+    return column.count("/") == 2
+
+
+def snapshot_paths(path: str, directory: str = SNAPSHOT_DIRECTORY):
+    name = splitext(basename(path))[0]
+    return (
+        join(directory, name + ".counts.npy"),
+        join(directory, name + ".locations.csv"),
+        join(directory, name + ".json"),
+    )
+
+
+def build(path: str, directory: str = SNAPSHOT_DIRECTORY, sha1: str = None) -> pd.DataFrame:
+    """
+    parse a csv and write its snapshot, returns the parsed dataframe
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    df = pd.read_csv(path)
+    dates = [column for column in df.columns if is_date(column)]
+    id_columns = [column for column in df.columns if not is_date(column)]
+
+    # blank cells turn up now and again, count them as 0
+    counts = df[dates].fillna(0).to_numpy(dtype=np.int32)
+
+    write(path, directory, sha1 or file_hash(path), df[id_columns], dates, counts)
+
+    # return the same dtypes a snapshot load would
+    return pd.concat([df[id_columns], pd.DataFrame(counts, columns=dates)], axis=1)
+
+
+def update(path: str, directory: str = SNAPSHOT_DIRECTORY, sha1: str = None):
+    """
+    bring the snapshot up to date with the csv, parsing as little as possible
+    sha1 of the csv can be passed in if it is already known
+    returns (dataframe, index of the first date which may have changed or None if nothing did)
+    """
+    sha1 = sha1 or file_hash(path)
+    if is_current(path, directory, sha1):
+        locations, dates, counts = load(path, directory)
+        return pd.concat([locations, pd.DataFrame(counts, columns=dates)], axis=1), None
+
+    try:
+        locations, dates, counts = load(path, directory)
+        incremental = meta(path, directory).get("incremental", 0)
+    except (OSError, ValueError):
+        return build(path, directory, sha1), 0
+    if incremental >= FULL_REBUILD_EVERY:
+        return build(path, directory, sha1), 0
+
+    # the new file must be the old one with columns appended, anything else is a full rebuild
+    header = list(pd.read_csv(path, nrows=0).columns)
+    new_dates = [column for column in header if is_date(column)]
+    if new_dates[:len(dates)] != dates:
+        return build(path, directory, sha1), 0
+
+    start = max(len(dates) - REVISION_WINDOW, 0)
+    id_columns = list(locations.columns)
+    tail = pd.read_csv(path, usecols=id_columns + new_dates[start:])
+
+    # rows must line up with the stored location index too
+    if not tail[id_columns].equals(locations):
+        return build(path, directory, sha1), 0
+
+    tail_counts = tail[new_dates[start:]].fillna(0).to_numpy(dtype=np.int32)
+    counts = np.concatenate([counts[:, :start], tail_counts], axis=1)
+    write(path, directory, sha1, locations, new_dates, counts, incremental + 1)
+
+    return pd.concat([locations, pd.DataFrame(counts, columns=new_dates)], axis=1), start
+
+
+def write(path: str, directory: str, sha1: str, locations: pd.DataFrame, dates: List[str], counts: np.ndarray, incremental: int = 0):
+    """
+    incremental is the number of incremental updates since the csv was last parsed in full
+    files are written to a temporary name and renamed over the old ones, so an old
+    snapshot which is still memory mapped by a reader is never truncated under it
+    """
+    counts_path, locations_path, meta_path = snapshot_paths(path, directory)
+    # two processes writing the same snapshot at once each rename only their own complete files
+    tmp = f".{os.getpid()}.tmp"
+
+    with open(counts_path + tmp, "wb") as f:
+        np.save(f, counts)
+    os.replace(counts_path + tmp, counts_path)
+    locations.to_csv(locations_path + tmp, index=False)
+    os.replace(locations_path + tmp, locations_path)
+
+    # meta is written last so a half written snapshot is never treated as valid
+    with open(meta_path + tmp, "w") as f:
+        json.dump({
+            "sha1": sha1,
+            "id_columns": list(locations.columns),
+            "dates": dates,
+            "incremental": incremental,
+        }, f)
+    os.replace(meta_path + tmp, meta_path)
+
+
+def meta(path: str, directory: str = SNAPSHOT_DIRECTORY) -> dict:
+    with open(snapshot_paths(path, directory)[2]) as f:
+        return json.load(f)
+
+
+def load(path: str, directory: str = SNAPSHOT_DIRECTORY):
+    """
+    returns (locations, dates, counts) from a snapshot, counts is memory mapped
+    """
+    counts_path, locations_path, _ = snapshot_paths(path, directory)
+
+    dates = meta(path, directory)["dates"]
+    locations = pd.read_csv(locations_path)
+    counts = np.load(counts_path, mmap_mode="r")
+
+    return locations, dates, counts
+
+
+def is_current(path: str, directory: str = SNAPSHOT_DIRECTORY, sha1: str = None) -> bool:
+    """
+    True if the snapshot was built from this exact csv
+    """
+    try:
+        built_from = meta(path, directory)["sha1"]
+    except (OSError, ValueError):
+        return False
+    return built_from == (sha1 or file_hash(path))
+
+
+if __name__ == '__main__':
+    # build step, run after pulling new data
+    # python snapshot.py [--full] [data source, see sources.py, COVID_DATA_SOURCE by default]
+    import sys
+    import sources
+    args = [arg for arg in sys.argv[1:] if arg != "--full"]
+    source = sources.from_spec(args[0]) if args else sources.default()
+    hashes = source.hashes()
+    rebuilt = []
+    for name, path in source.paths().items():
+        if "--full" in sys.argv:
+            build(path, sha1=hashes[name])
+            rebuilt.append(name)
+        elif update(path, sha1=hashes[name])[1] is not None:
+            rebuilt.append(name)
+    print("rebuilt:", rebuilt or "nothing")
@@ -0,0 +1,179 @@
+"""
+Where the CSSE time series csv files come from
+
+    GitSource       - a checkout of the CSSE repo, synced with git pull (the default)
+    DirectorySource - a plain directory, e.g. a read only volume kept up to date by another job
+    TarballSource   - a .tar(.gz) of the csv files, unpacked next to the snapshot
+
+Choose one with the COVID_DATA_SOURCE environment variable: "git:<checkout>",
+"dir:<directory>" or "tar:<tarball>".
+
+Files are only hashed again when their mtime or size changes, so checking a source
+which hasn't changed costs a stat per file.
+"""
+
+import hashlib
+import logging
+import os
+import subprocess
+import tarfile
+from os.path import basename, getmtime, join
+from typing import Dict
+
+import snapshot
+
+NAMES = ["confirmed_global", "deaths_global", "recovered_global", "confirmed_US", "deaths_US"]
+TIME_SERIES = join("csse_covid_19_data", "csse_covid_19_time_series")
+CHECKOUT = "COVID-19"
+# a file the sync job can write with the revision it fetched
+REVISION_FILE = "REVISION"
+
+
+def filename(name: str) -> str:
+    return f"time_series_covid19_{name}.csv"
+
+
+class Source:
+    def __init__(self, directory: str):
+        self.directory = directory
+        # path -> ((mtime, size), sha1)
+        self.seen = {}
+
+    def sync(self):
+        """
+        fetch new data, if this source can
+        """
+
+    def paths(self) -> Dict[str, str]:
+        return {name: join(self.directory, filename(name)) for name in NAMES}
+
+    def hashes(self) -> Dict[str, str]:
+        """
+        name -> sha1 of each file, only rehashed if it has been touched
+        """
+        result = {}
+        for name, path in self.paths().items():
+            stat = os.stat(path)
+            key = (stat.st_mtime_ns, stat.st_size)
+            if path not in self.seen or self.seen[path][0] != key:
+                self.seen[path] = (key, snapshot.file_hash(path))
+            result[name] = self.seen[path][1]
+        return result
+
+    def version(self) -> str:
+        """
+        short hash of every file, changes whenever any of the data does
+        """
+        sha1 = hashlib.sha1()
+        for name, file_hash in self.hashes().items():
+            sha1.update(file_hash.encode())
+        return sha1.hexdigest()[:12]
+
+    def revision(self) -> str:
+        """
+        where the data came from, as the source knows it
+        """
+        try:
+            with open(join(self.directory, REVISION_FILE)) as f:
+                return f.read().strip()
+        except OSError:
+            pass
+        # otherwise when it was last written
+        return str(int(max(getmtime(path) for path in self.paths().values())))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.directory!r})"
+
+
+class DirectorySource(Source):
+    pass
+
+
+class GitSource(Source):
+    def __init__(self, checkout: str = CHECKOUT):
+        super().__init__(join(checkout, TIME_SERIES))
+        self.checkout = checkout
+
+    def sync(self):
+        """
+        get the latest data from the CSSE repo
+        """
+        # runs on the refresh thread, logged so it ends up in app_log.log
+        try:
+            process = subprocess.run(["git", "pull", "--ff-only"], cwd=self.checkout, capture_output=True, text=True, timeout=600)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            logging.warning("git pull failed: %r", e)
+            return
+        output = (process.stdout + process.stderr).strip()
+        if process.returncode != 0:
+            logging.warning("git pull failed with exit code %d: %s", process.returncode, output)
+        else:
+            logging.info("git pull: %s", output)
+
+    def revision(self) -> str:
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], cwd=self.checkout, capture_output=True, text=True).stdout.strip()
+        except OSError:
+            return ""
+
+    def __repr__(self):
+        return f"GitSource({self.checkout!r})"
+
+
+class TarballSource(Source):
+    """
+    the csv files can be anywhere in the tarball, they are found by name
+    """
+    def __init__(self, tarball: str, directory: str = join(snapshot.SNAPSHOT_DIRECTORY, "source")):
+        super().__init__(directory)
+        self.tarball = tarball
+        self.unpacked = None
+
+    def unpack(self):
+        """
+        unpack the csv files if the tarball has changed since they last were
+        """
+        stat = os.stat(self.tarball)
+        key = (stat.st_mtime_ns, stat.st_size)
+        if self.unpacked == key:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        wanted = {filename(name) for name in NAMES}
+        with tarfile.open(self.tarball) as tar:
+            for member in tar.getmembers():
+                if member.isfile() and basename(member.name) in wanted:
+                    path = join(self.directory, basename(member.name))
+                    tmp = f"{path}.{os.getpid()}.tmp"
+                    with tar.extractfile(member) as source, open(tmp, "wb") as f:
+                        for block in iter(lambda: source.read(1 << 20), b""):
+                            f.write(block)
+                    os.replace(tmp, path)
+        self.unpacked = key
+
+    def paths(self) -> Dict[str, str]:
+        self.unpack()
+        return super().paths()
+
+    def revision(self) -> str:
+        return snapshot.file_hash(self.tarball)[:12]
+
+    def __repr__(self):
+        return f"TarballSource({self.tarball!r})"
+
+
+def from_spec(spec: str) -> Source:
+    """
+    "git:COVID-19", "dir:/data/csse" or "tar:/data/csse.tar.gz"
+    """
+    kind, _, path = spec.partition(":")
+    if kind == "git":
+        return GitSource(path or CHECKOUT)
+    if kind == "dir":
+        return DirectorySource(path)
+    if kind == "tar":
+        return TarballSource(path)
+    raise ValueError(f"unknown data source {spec!r}")
+
+
+def default() -> Source:
+    return from_spec(os.environ.get("COVID_DATA_SOURCE", f"git:{CHECKOUT}"))
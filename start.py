@@ -1,4 +1,20 @@
 # Starts the waitress server
+import os
+import threading
+
 from waitress import serve
-from web import app
-serve(app, host='0.0.0.0', port=80)
\ No newline at end of file
+from web import create_app, use_render_pool, warmup
+from refresh import refresher
+
+# pull and load the data before anything else
+app = create_app()
+
+# draw charts in worker processes, one per core
+use_render_pool(os.cpu_count())
+
+# fill the chart caches without holding up the server starting
+threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
+# pull and reload the data every hour, in the background
+refresher.schedule(60 * 60)
+serve(app, host='0.0.0.0', port=80)
@@ -2,167 +2,434 @@
 Flask server to display live(ish) data report
 """
 
-import io
+import gzip
+import hashlib
 # imports and globals
 import logging
-from datetime import datetime
+import logging.handlers
+import queue
+import threading
 import time
+from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Tuple
 
-from bokeh.embed import components
-from flask import Flask, Response, render_template, request, redirect, abort
+from flask import Flask, Response, render_template, request, redirect, abort, jsonify, url_for, g, has_request_context
 from flask.logging import default_handler
-from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
+try:
+    import brotli
+except ImportError:
+    # pages are only sent gzipped then
+    brotli = None
+
+import access_log
+import analytics
+import api
+import cache
+import charts
+import hostfilter
+import metrics
 import plot
-
-last_update = datetime.now().strftime("%B %d, %Y %H:%M")
+import projections
+import rankings
+import render_pool
+import shared
+from refresh import refresher
 
 # start flask app
+# importing this module only defines the app, create_app loads the data and starts the background threads
 app = Flask(__name__)
 
 
 # set up flask logging
-class RequestFormatter(logging.Formatter):
-    def format(self, record):
-        try:
+class RequestFilter(logging.Filter):
+    """
+    copies the request onto the record while still on the request thread,
+    formatting happens later on the logging thread
+    """
+    def filter(self, record):
+        if has_request_context():
             record.url = request.url
             record.remote_addr = request.remote_addr
-        except:
+        else:
             record.url = None
             record.remote_addr = None
+        return True
 
-        return super().format(record)
-
-formatter = RequestFormatter(
+formatter = logging.Formatter(
     '[%(asctime)s] %(remote_addr)s requested %(url)s\n'
     '%(levelname)s in %(module)s: %(message)s'
 )
 
-default_handler.setFormatter(formatter)
+log_listener = None
+
+
+def setup_logging():
+    """
+    records are queued by the request and formatted and written by a background thread
+    """
+    global log_listener
+    if log_listener is not None:
+        return
+    file_handler = logging.FileHandler('app_log.log', mode='a')
+    file_handler.setFormatter(formatter)
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestFilter())
+    log_listener = logging.handlers.QueueListener(log_queue, file_handler)
+    log_listener.start()
+
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(queue_handler)
+    # flask's own handler would format everything a second time
+    app.logger.removeHandler(default_handler)
+
+
+# one json line per request, batched and written in the background once started
+access = access_log.AccessLog()
+
+
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    metrics.begin(request.endpoint)
+
 
-logging.basicConfig(filename='app_log.log',level=logging.INFO)
-logging.FileHandler('app_log.log', mode='a')
+# answers unwanted requests before they get anywhere near the plotting code
+request_filter = hostfilter.Filter()
 
-root = logging.getLogger()
-root.addHandler(default_handler)
 
-BANNED = ["118.172.154.178"]
 @app.before_request
 def block():
-    if request.remote_addr in BANNED:
-        abort(403)
+    # only the banned list applies when debugging locally
+    if app.debug:
+        if request.remote_addr in hostfilter.BANNED:
+            abort(403)
+        return None
+    return request_filter.check(request)
+
+
+# set by create_app when the data comes from a loader process, see shared.py
+follower = None
+
+
+@app.before_request
+def follow_shared():
+    if follower is not None:
+        follower.check()
 
 
 @app.after_request
 def after_request(response):
+    duration = time.perf_counter() - g.start
+    metrics.registry.observe("covid_request_seconds", duration, endpoint=request.endpoint or "")
+    response.headers["Server-Timing"] = metrics.server_timing(metrics.end(), duration)
+
     # log usage data
-    logging.info(f"{datetime.now():%Y-%m-%d %H:%M:%S%z} | {request.remote_addr} | {request.url} | {request.user_agent.platform}")
-
-    # lets troll
-    if not app.debug:
-        if request.url.startswith("http://146.148.32.5"):
-            time.sleep(10)
-            logging.info("redirecting an IP URL")
-            return redirect("http://90.207.238.183")
-        # for some reason we get a bunch of these
-        elif request.url == "http://covid-19/":
-            time.sleep(60)
-        # just capture all cases too
-        elif not (request.url.startswith("http://ogent.uk") or request.url.startswith("http://bettercovid19data.com")):
-            time.sleep(10)
-            logging.info("redirecting a non o-gent url")
-            return redirect("http://www.google.com")
-    else:
-        logging.info("app is in debug mode")
-        
+    access.log(
+        time=f"{datetime.now():%Y-%m-%d %H:%M:%S}",
+        remote_addr=request.remote_addr,
+        method=request.method,
+        url=request.url,
+        endpoint=request.endpoint,
+        status=response.status_code,
+        duration_ms=round(duration * 1000, 2),
+        cache=g.get("cache"),
+        platform=request.user_agent.platform,
+    )
     return response
 
 
+def record_cache(hit: bool):
+    """
+    note a cache hit or miss for the access log
+    """
+    if has_request_context():
+        g.cache = "hit" if hit else "miss"
+
+
 # begin app code
+
+# default selections of the main page and of the charts on their own
+DEFAULT_COUNTRIES = ["United Kingdom", "France", "Germany", "Spain"]
+DEFAULT_CHART_COUNTRIES = ["United Kingdom", "New York"]
+
+# how often each selection of countries is asked for, to know what to pre-render
+popular = Counter()
+# most_common iterates the dict, a new key added by another request meanwhile would break it
+popular_lock = threading.Lock()
+POPULAR_LIMIT = 10000
+
+
+def selected_countries(dataset: plot.Dataset, default: List[str]) -> List[str]:
+    """
+    Countries as GET paramters, sorted so any order of the same countries is the same chart
+    """
+    if request.args.get("All") == "on":
+        return sorted(dataset.country_data.keys())
+    countries = sorted({country for country, value in request.args.items() if value == "on" and country in dataset.country_data})
+    countries = countries or sorted(default)
+
+    with popular_lock:
+        popular[tuple(countries)] += 1
+        if len(popular) > POPULAR_LIMIT:
+            kept = popular.most_common(POPULAR_LIMIT // 10)
+            popular.clear()
+            popular.update(dict(kept))
+    return countries
+
+
+# whole pages of /, keyed by selection, full table or not, mobile or not and dataset version
+# each is kept plain and compressed, so a repeat view is a dict lookup
+PAGE_CACHE_BYTES = 16 * 1024 * 1024
+page_cache = cache.ByteCache(PAGE_CACHE_BYTES)
+refresher.on_refresh(page_cache.clear)
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# best first
+ENCODINGS = (["br"] if brotli is not None else []) + ["gzip", "identity"]
+
+
+def compressed(body: bytes) -> dict:
+    """
+    encoding -> body
+    """
+    encodings = {"identity": body, "gzip": gzip.compress(body, GZIP_LEVEL)}
+    if brotli is not None:
+        encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return encodings
+
+
+def negotiate() -> str:
+    for encoding in ENCODINGS:
+        if encoding == "identity" or request.accept_encodings[encoding]:
+            return encoding
+
+
 @app.route('/')
 def index():
     """
     Main report page
-    Graphs are rendered each time the page is loaded
+    Rendered once per selection and dataset version, then served from page_cache
     """
 
+    # one dataset for the whole request, even if a refresh swaps in a new one
+    dataset = plot.DATASET
+
     # User input for countries
-    countries = []
-    if request.args.get("All") == "on":
-        countries = plot.COUNTRY_DATA.keys()
-    else:
-        for country in plot.COUNTRY_DATA.keys():
-            if request.args.get(country) == "on":
-                countries.append(country)
-    if countries == []:
-        countries = ["United Kingdom", "France", "Germany", "Spain"] # pick some default countries
-    
-    # generate the GET parameters for other plots
-    param = "?"
-    for country in countries:
-        param += country + "=on&"
-    param = param.replace(" ", "+")
-
-    
-    show_all = request.args.get("Table_all")
-    if show_all == "on":
-        summary_table = plot.summary_table(plot.sorted_countries())
-    else:
-        summary_table = plot.summary_table(plot.sorted_countries()[0:10])
+    countries = selected_countries(dataset, DEFAULT_COUNTRIES)
+    show_all = request.args.get("Table_all") == "on"
 
     # Render desktop version or mobile version
     # Not ideal but necessary due to matplotlib and bokeh limitations
-    mobile = ["android", "iphone"]
-    if request.user_agent.platform in mobile:
-        
-
-        return render_template(
-            "web.html",
-            mobile=True,
-            script_plot1="",
-            div_plot1="",
-            last_update=last_update,
-            param=param,
-            table=summary_table
-        )
+    mobile = request.user_agent.platform in ["android", "iphone"]
+
+    key = (tuple(countries), show_all, mobile, dataset.version)
+    encoding = negotiate()
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()[:20] + "-" + encoding
+    # the browser has this page already, nothing to render or look up
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        encodings = cached_page(dataset, countries, show_all, mobile)
+        response = Response(encodings[encoding], mimetype="text/html")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+
+    response.set_etag(etag)
+    response.vary.update(["Accept-Encoding", "User-Agent"])
+    # always check back, the page changes with the data
+    response.cache_control.no_cache = True
+    return response
+
+
+def cached_page(dataset: plot.Dataset, countries: List[str], show_all: bool, mobile: bool) -> dict:
+    """
+    encoding -> body of / for a selection, rendered and compressed once per dataset version
+    needs a request context (url_for and the templates), warmup makes one of its own
+    """
+    key = (tuple(countries), show_all, mobile, dataset.version)
+    encodings = page_cache.get(key)
+    record_cache(encodings is not None)
+    if encodings is None:
+        # generate the GET parameters for other plots
+        param = "?"
+        for country in countries:
+            param += country + "=on&"
+        param = param.replace(" ", "+")
+        images = {endpoint: f"/{endpoint}.{charts.FORMATS[endpoint]}{param}" for endpoint in charts.ENDPOINTS}
+        series_url = url_for('api_series', v=dataset.version, location=countries, metric="deaths", normalised=1)
+
+        body = page(dataset, show_all, mobile, images, series_url).encode()
+        with metrics.timer("compress"):
+            encodings = compressed(body)
+        page_cache.put(key, encodings, size=sum(len(value) for value in encodings.values()))
+    return encodings
+
+
+def page(dataset: plot.Dataset, show_all: bool, mobile: bool, images: dict, series_url: str) -> str:
+    """
+    the report page, images is endpoint -> url of each chart
+    used by the static export too, so nothing in here can depend on the request
+    """
+    last_update = dataset.built.strftime("%B %d, %Y %H:%M")
+
+    # a slice of the rankings made when the data was loaded
+    with metrics.timer("summary_table"):
+        summary_table = dataset.rankings.page("deaths", limit=None if show_all else 10)
+
+    if mobile:
+        with metrics.timer("template"):
+            return render_template(
+                "web.html",
+                mobile=True,
+                script_plot1="",
+                div_plot1="",
+                last_update=last_update,
+                images=images,
+                table=summary_table
+            )
 
     else:
-        # generate plot 1
-        script_plot1, div_plot1 = components(plot.deaths_since_start(countries))
+        from bokeh.palettes import Colorblind as palette
 
-        return render_template(
-            "web.html", 
-            script_plot1=script_plot1,  
-            div_plot1=div_plot1,
-            last_update=last_update,
-            param=param,
-            table=summary_table
-        )
+        # generate plot 1
+        # the plot is the same empty document every time, the page fetches the data for it
+        with metrics.timer("bokeh"):
+            script_plot1, div_plot1 = bokeh_document()
+
+        with metrics.timer("template"):
+            return render_template(
+                "web.html", 
+                script_plot1=script_plot1,  
+                div_plot1=div_plot1,
+                series_url=series_url,
+                palette=palette[8],
+                last_update=last_update,
+                images=images,
+                table=summary_table
+            )
 
 
 # Matplotlib serving section
 
+# rendered pngs, keyed by endpoint, countries and dataset version
+PNG_CACHE_BYTES = 64 * 1024 * 1024
+png_cache = cache.ByteCache(PNG_CACHE_BYTES)
+# old versions can never be hit again, free them as soon as there is new data
+refresher.on_refresh(png_cache.clear)
+# the same for svg, they are a few kB each
+SVG_CACHE_BYTES = 16 * 1024 * 1024
+svg_cache = cache.ByteCache(SVG_CACHE_BYTES)
+refresher.on_refresh(svg_cache.clear)
+
+
+@lru_cache()
+def bokeh_document():
+    """
+    script and div of the interactive deaths plot, it has no data in it so only needs making once
+    """
+    from bokeh.embed import components
+
+    return components(plot.deaths_since_start_document())
+
+
+# optional pool of worker processes to draw in, see use_render_pool
+renderer = None
+
+
+def use_render_pool(processes: int = render_pool.PROCESSES, queue_size: int = render_pool.QUEUE_SIZE, timeout: float = render_pool.TIMEOUT):
+    """
+    draw charts in worker processes instead of the request threads
+    call before the server starts, the workers are forked from this process
+    """
+    global renderer
+    renderer = render_pool.RenderPool(processes, queue_size, timeout)
+    # before the warmup, so it draws with the new data
+    refresher.on_refresh(renderer.restart, first=True)
+
+
+def png(endpoint: str, countries: List[str], dataset: plot.Dataset) -> Tuple[bytes, bool]:
+    """
+    rendered chart, from the cache if it has been drawn before for this data
+    also returns False if it is a stand in from a busy render pool, not the chart for this data
+    """
+    key = (endpoint, tuple(countries), dataset.version)
+    image = png_cache.get(key)
+    record_cache(image is not None)
+    fresh = True
+    if image is None:
+        if renderer is not None:
+            # figure and rasterize happen in the worker, only the wait is seen here
+            with metrics.timer("render_pool"):
+                image, fresh = renderer.render(endpoint, countries, dataset)
+        else:
+            image = charts.render(endpoint, countries, dataset)
+        # don't keep a stand in image from a busy render pool
+        if fresh:
+            png_cache.put(key, image)
+    return image, fresh
+
+
+def svg(endpoint: str, countries: List[str], dataset: plot.Dataset) -> Tuple[bytes, bool]:
+    """
+    chart drawn as svg, from the cache if it has been drawn before for this data
+    cheap enough that it never goes to the render pool, so it is always fresh
+    """
+    key = (endpoint, tuple(countries), dataset.version)
+    image = svg_cache.get(key)
+    record_cache(image is not None)
+    if image is None:
+        image = charts.render_svg(endpoint, countries, dataset)
+        svg_cache.put(key, image)
+    return image, True
+
+
+# format -> (draw function, mimetype)
+CHART_FORMATS = {
+    "png": (png, "image/png"),
+    "svg": (svg, "image/svg+xml"),
+}
+
+
+def chart_response(endpoint: str, format: str = "png") -> Response:
+    """
+    the chart for the requested countries, or a 304 if the browser already has it
+    """
+    dataset = plot.DATASET
+    # pick some default countries
+    countries = selected_countries(dataset, DEFAULT_CHART_COUNTRIES)
+
+    # the chart only depends on these, so the etag can be checked before drawing anything
+    etag = hashlib.sha1(repr((endpoint, format, countries, dataset.version)).encode()).hexdigest()[:20]
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        draw, mimetype = CHART_FORMATS[format]
+        image, fresh = draw(endpoint, countries, dataset)
+        response = Response(image, mimetype=mimetype)
+        if not fresh:
+            # a stand in must not be cached as the chart for this data, ask again next time
+            response.cache_control.no_store = True
+            return response
+
+    response.set_etag(etag)
+    response.last_modified = dataset.built
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+
 @app.route('/acceleration_deaths_plot.png')
 def accelation_deaths():
     """
     Countries as GET paramters
     """
-    # handle input
-    countries = []
-    for country in plot.COUNTRY_DATA.keys():
-        if request.args.get(country) == "on":
-            countries.append(country)
-    if countries == []:
-        # pick some default countries
-        countries = ["United Kingdom", "New York"]  
-
-    # get the figure
-    fig = plot.acceleration_deaths_plot(countries)
-
-    # output the figure as a response
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output, bbox_inches='tight')
-    return Response(output.getvalue(), mimetype='image/png')
+    return chart_response("acceleration_deaths_plot")
 
 
 @app.route('/acceleration_deaths_plot_mobile.png')
@@ -171,27 +438,7 @@ def accelation_deaths_mobile():
     MOBILE VERSION
     Countries as GET paramters
     """
-    # handle input
-    countries = []
-    for country in plot.COUNTRY_DATA.keys():
-        if request.args.get(country) == "on":
-            countries.append(country)
-    if countries == []:
-        # pick some default countries
-        countries = ["United Kingdom", "New York"]  
-
-    # get the figure
-    fig = plot.acceleration_deaths_plot(countries)
-
-    # increase font size
-    ax = fig.axes[0]
-    for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
-        item.set_fontsize(18)
-    
-    # output the figure as a response
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output, bbox_inches='tight')
-    return Response(output.getvalue(), mimetype='image/png')
+    return chart_response("acceleration_deaths_plot_mobile")
 
 
 @app.route('/acceleration_confirmed_plot.png')
@@ -199,22 +446,7 @@ def accelation_confirmed():
     """
     Countries as GET paramters
     """
-    # handle input
-    countries = []
-    for country in plot.COUNTRY_DATA.keys():
-        if request.args.get(country) == "on":
-            countries.append(country)
-    if countries == []:
-        # pick some default countries
-        countries = ["United Kingdom", "New York"]  
-
-    # get the figure
-    fig = plot.acceleration_confirmed_plot(countries)
-    
-    # output the figure as a response
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output, bbox_inches='tight')
-    return Response(output.getvalue(), mimetype='image/png')
+    return chart_response("acceleration_confirmed_plot")
 
 
 @app.route('/acceleration_confirmed_plot_mobile.png')
@@ -223,26 +455,7 @@ def accelation_confirmed_mobile():
     MOBILE VERSION
     Countries as GET paramters
     """
-    # handle input
-    countries = []
-    for country in plot.COUNTRY_DATA.keys():
-        if request.args.get(country) == "on":
-            countries.append(country)
-    if countries == []:
-        # pick some default countries
-        countries = ["United Kingdom", "New York"]  
-
-    # get the figure
-    fig = plot.acceleration_confirmed_plot(countries)
-    
-    # increase font size
-    ax = fig.axes[0]
-    for item in ([ax.title, ax.xaxis.label, ax.yaxis.label] + ax.get_xticklabels() + ax.get_yticklabels()):
-        item.set_fontsize(18)
-    # output the figure as a response
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output, bbox_inches='tight')
-    return Response(output.getvalue(), mimetype='image/png')
+    return chart_response("acceleration_confirmed_plot_mobile")
 
 
 @app.route('/deaths_since_start_mobile.png')
@@ -251,42 +464,253 @@ def deaths_since_start_mobile():
     MOBILE VERSION
     Countries as GET paramters
     """
-    # handle input
-    countries = []
-    for country in plot.COUNTRY_DATA.keys():
-        if request.args.get(country) == "on":
-            countries.append(country)
-    if countries == []:
-        # pick some default countries
-        countries = ["United Kingdom", "New York"]  
+    return chart_response("deaths_since_start_mobile")
+
+
+@app.route('/deaths_projection_plot.png')
+def deaths_projection():
+    """
+    Countries as GET paramters
+    """
+    return chart_response("deaths_projection_plot")
+
+
+@app.route('/deaths_projection_plot_mobile.png')
+def deaths_projection_mobile():
+    """
+    MOBILE VERSION
+    Countries as GET paramters
+    """
+    return chart_response("deaths_projection_plot_mobile")
+
+
+@app.route('/<name>.svg')
+def chart_svg(name):
+    """
+    Any chart drawn as svg
+    Countries as GET paramters
+    """
+    if name not in charts.ENDPOINTS:
+        abort(404)
+    return chart_response(name, "svg")
+
 
-    # get the figure
-    fig = plot.deaths_since_start_mobile(countries)
+# Data API section
 
-    # make room for labels
-    fig.subplots_adjust(bottom=0.15)
+# rows of /api/table by default and at most
+TABLE_PAGE = 50
+TABLE_PAGE_LIMIT = 1000
 
-    # output the figure as a response
-    output = io.BytesIO()
-    FigureCanvas(fig).print_png(output, bbox_inches='tight')
-    return Response(output.getvalue(), mimetype='image/png')
+# serialised /api/series responses, keyed by the request and dataset version
+SERIES_CACHE_BYTES = 32 * 1024 * 1024
+series_cache = cache.ByteCache(SERIES_CACHE_BYTES)
+refresher.on_refresh(series_cache.clear)
+
+
+def series(countries: List[str], names: List[str], normalised: bool, format: str, dataset: plot.Dataset, start: str = analytics.DEFAULT_START) -> bytes:
+    """
+    body of an /api/series response, from the cache if possible
+    """
+    key = (tuple(countries), tuple(names), normalised, format, start, dataset.version)
+    value = series_cache.get(key)
+    record_cache(value is not None)
+    if value is None:
+        with metrics.timer("series"):
+            if format == "binary":
+                value = api.series_binary(dataset, countries, names, normalised, start)
+            else:
+                value = api.series_json(dataset, countries, names, normalised, start)
+        series_cache.put(key, value)
+    return value
+
+
+@app.route('/api/series')
+def api_series():
+    """
+    Series of the requested locations
+    ?v=<dataset version>&location=France&location=Spain&metric=deaths&normalised=1&format=json|binary&start=per_capita
+    versioned urls never change so can be cached forever, any other version redirects to the current one
+    """
+    dataset = plot.DATASET
+    version = request.args.get("v")
+    if version is not None and version != dataset.version:
+        args = request.args.to_dict(flat=False)
+        args["v"] = dataset.version
+        return redirect(url_for('api_series', **args))
+
+    # keep the order asked for, it is the order of the result
+    countries = [country for country in dict.fromkeys(request.args.getlist("location")) if country in dataset.country_data]
+    names = api.parse_metrics(request.args.getlist("metric"))
+    normalised = request.args.get("normalised") == "1"
+    format = "binary" if request.args.get("format") == "binary" else "json"
+    # which outbreak start first_day is, see analytics.START_CRITERIA
+    start = api.parse_start(request.args.get("start"))
+
+    body = series(countries, names, normalised, format, dataset, start)
+    if format == "binary":
+        # the locations and the rest of the payload are in the body too, see api.series_binary
+        response = Response(body, mimetype="application/octet-stream")
+    else:
+        response = Response(body, mimetype="application/json")
+
+    response.set_etag(hashlib.sha1(repr((countries, names, normalised, format, start, dataset.version)).encode()).hexdigest()[:20])
+    response.last_modified = dataset.built
+    response.cache_control.public = True
+    if version is not None:
+        response.cache_control.max_age = 365 * 24 * 60 * 60
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.max_age = 60
+    return response.make_conditional(request)
+
+
+@app.route('/api/table')
+def api_table():
+    """
+    A page of the summary table
+    ?sort=deaths|confirmed|deaths_acceleration|confirmed_acceleration|deaths_per_capita|confirmed_per_capita
+    &order=desc|asc&offset=0&limit=50
+    """
+    dataset = plot.DATASET
+    sort = request.args.get("sort", rankings.DEFAULT_SORT)
+    if sort not in rankings.SORTS:
+        abort(400)
+    descending = request.args.get("order", "desc") != "asc"
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    limit = min(max(request.args.get("limit", TABLE_PAGE, type=int), 0), TABLE_PAGE_LIMIT)
+
+    response = jsonify({
+        "version": dataset.version,
+        "sort": sort,
+        "order": "desc" if descending else "asc",
+        "offset": offset,
+        "limit": limit,
+        "total": len(dataset.rankings),
+        "columns": rankings.COLUMNS,
+        "rows": dataset.rankings.page(sort, descending, offset, limit),
+    })
+    response.set_etag(hashlib.sha1(repr((sort, descending, offset, limit, dataset.version)).encode()).hexdigest()[:20])
+    response.last_modified = dataset.built
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
+
+
+@app.route('/api/projection')
+def api_projection():
+    """
+    Projected cumulative counts of the requested locations, fitted when the data was loaded
+    ?location=France&location=Spain&metric=deaths|confirmed&model=log_linear|logistic|gompertz&normalised=1
+    """
+    dataset = plot.DATASET
+    countries = [country for country in dict.fromkeys(request.args.getlist("location")) if country in dataset.country_data]
+    metric = request.args.get("metric", "deaths")
+    model = request.args.get("model", projections.DEFAULT_MODEL)
+    if metric not in projections.METRICS or model not in projections.MODELS:
+        abort(400)
+    normalised = request.args.get("normalised") == "1"
+
+    response = jsonify(api.projection(dataset, countries, metric, model, normalised))
+    response.set_etag(hashlib.sha1(repr((countries, metric, model, normalised, dataset.version)).encode()).hexdigest()[:20])
+    response.last_modified = dataset.built
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response.make_conditional(request)
+
+
+# pre-rendering, so the first request after new data is a cache hit
+WARMUP_POPULAR = 10
+WARMUP_WORKERS = 4
+
+
+def warmup(dataset: plot.Dataset = None):
+    """
+    render every chart and the desktop and mobile pages for the default selections and the most popular ones
+    """
+    dataset = dataset or plot.DATASET
+    selections = [tuple(sorted(DEFAULT_COUNTRIES)), tuple(sorted(DEFAULT_CHART_COUNTRIES))]
+    with popular_lock:
+        most_popular = popular.most_common(WARMUP_POPULAR)
+    selections += [countries for countries, _ in most_popular if countries not in selections]
+    # drop any countries the new data doesn't have
+    selections = [[country for country in countries if country in dataset.country_data] for countries in selections]
+
+    jobs = [(CHART_FORMATS[charts.FORMATS[endpoint]][0], (endpoint, countries, dataset)) for countries in selections for endpoint in charts.ENDPOINTS]
+    jobs += [(series, (countries, ["deaths"], True, "json", dataset)) for countries in selections]
+    jobs += [(warm_page, (dataset, countries, mobile)) for countries in selections for mobile in [False, True]]
+    with ThreadPoolExecutor(WARMUP_WORKERS) as pool:
+        for job in [pool.submit(function, *args) for function, args in jobs]:
+            job.result()
+
+
+def warm_page(dataset: plot.Dataset, countries: List[str], mobile: bool):
+    # outside of any real request, like the static export
+    with app.test_request_context():
+        cached_page(dataset, countries, False, mobile)
+
+
+refresher.on_refresh(warmup)
 
 
 # app maintanance section
 @app.route('/update')
 def update():
     """
-    update data sources on load
+    update data sources in the background
+    returns the state of the refresh, requests carry on using the current data until it is done
     """
-    global last_update
-    global plot
-    last_update = datetime.now().strftime("%B %d, %Y %H:%M")
-    from importlib import reload
-    reload(plot)
-    return "updated!"
+    # workers following a loader process leave refreshing to it
+    if follower is None:
+        refresher.trigger()
+    return jsonify(refresher.state())
+
 
+@app.route('/stats')
+def stats():
+    """
+    request filter and cache counters
+    """
+    return jsonify({
+        "filter": request_filter.stats(),
+        "png_cache": png_cache.stats(),
+        "svg_cache": svg_cache.stats(),
+        "series_cache": series_cache.stats(),
+        "page_cache": page_cache.stats(),
+        "access_log": access.stats(),
+    })
+
+
+@app.route('/metrics')
+def metrics_text():
+    """
+    Prometheus text format, timings plus the size of the current data
+    """
+    dataset = plot.DATASET
+    metrics.registry.set("covid_dataset_bytes", dataset.nbytes())
+    metrics.registry.set("covid_dataset_locations", len(dataset.store.keys))
+    metrics.registry.set("covid_dataset_days", len(dataset.dates))
+    metrics.registry.set("covid_process_max_rss_bytes", metrics.max_rss())
+    return Response(metrics.registry.exposition(), mimetype="text/plain; version=0.0.4")
+
+def create_app(sync: bool = True, shared_directory: str = None) -> Flask:
+    """
+    get everything ready to serve: logging, the access log writer and the data,
+    pulled from the CSSE repo first if sync
+    with shared_directory the data is attached from the loader process instead (see
+    shared.py), waiting for it to publish if it hasn't yet
+    """
+    global follower
+    setup_logging()
+    access.start()
+    if shared_directory is not None:
+        shared.wait(shared_directory)
+        follower = shared.Follower(shared_directory)
+        follower.check()
+        return app
+    plot.load(sync)
+    return app
 
 
 if __name__ == '__main__':
     # start the flask server
-	app.run(port=5000, debug=True)
+	create_app().run(port=5000, debug=True)